@@ -0,0 +1,42 @@
+"""
+Benchmarks for django-usda-nutrition.
+
+Each module is runnable on its own, for example:
+
+    python -m benchmarks.converters
+
+`setup()` configures Django the same way `manage.py` does, but against an
+in-memory SQLite database unless `USDA_BENCH_DB` names a database file. Set
+`USDA_BENCH_ENGINE` to benchmark another backend, for example
+`django.db.backends.postgresql` with `USDA_BENCH_DB` naming the database
+(connection details come from the usual `PG*` environment variables).
+"""
+import os
+import timeit
+
+import django
+from django.conf import settings
+
+
+def setup():
+    if not settings.configured:
+        settings.configure(
+            DATABASES={
+                'default': {
+                    'ENGINE': os.environ.get('USDA_BENCH_ENGINE', 'django.db.backends.sqlite3'),
+                    'NAME': os.environ.get('USDA_BENCH_DB', ':memory:')
+                }
+            },
+            INSTALLED_APPS=[
+                'usda_nutrition',
+            ],
+            MIDDLEWARE_CLASSES=[],
+        )
+    django.setup()
+
+
+def best_of(func, number, repeat=5):
+    """
+    Return the best time per call of `func`, in seconds.
+    """
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
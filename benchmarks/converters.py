@@ -0,0 +1,48 @@
+"""
+Per-row cost of converting raw SR rows into model instances: the original
+per-cell `_meta.get_field()`/`value_for_field()` dispatch versus the
+precompiled converters used by `import_usda`.
+"""
+from benchmarks import best_of, setup
+
+
+def legacy_value_for_field(field, value):
+    from django.db import models
+
+    if type(field) in [models.BooleanField, models.NullBooleanField]:
+        return {
+            'Y': True,
+            'N': False,
+            '': None
+        }[value]
+    return value or None
+
+
+def legacy_convert(model_cls, field_list, row):
+    new_instance = model_cls()
+    for index, field in enumerate(field_list):
+        value = legacy_value_for_field(model_cls._meta.get_field(field), row[index])
+        setattr(new_instance, field, value)
+    return new_instance
+
+
+def main():
+    setup()
+    from usda_nutrition.management.commands import import_usda
+    from usda_nutrition.sources import get_source
+
+    print('%-14s %12s %12s %8s' % ('file', 'before (us)', 'after (us)', 'speedup'))
+    source = get_source()
+    for info in import_usda.available_input_files(source):
+        model_cls, field_list = info['model'], info['fields']
+        rows = list(import_usda.read_rows(info['filename'], source))
+        convert = import_usda.compile_converter(model_cls, field_list)
+
+        before = best_of(lambda: [legacy_convert(model_cls, field_list, row) for row in rows], 1)
+        after = best_of(lambda: [convert(row) for row in rows], 1)
+        print('%-14s %12.2f %12.2f %7.1fx' % (
+            info['filename'], before / len(rows) * 1e6, after / len(rows) * 1e6, before / after))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Latency of multi-nutrient range queries ("protein > x and fat < y, ordered by
+fibre") against the nutrient matrix, at SR28's size.
+
+Uses the nutrient values in the database if there are any, and otherwise a
+synthetic matrix with SR28's shape (see `benchmarks.similarity`).
+"""
+import random
+import time
+
+from benchmarks import setup
+from benchmarks.search import percentile
+from benchmarks.similarity import SYNTHETIC_NUTRIENTS, synthetic_values
+
+
+QUERIES = 1000
+
+
+def main():
+    setup()
+    from django.core.management import call_command
+    from usda_nutrition import models
+    from usda_nutrition.matrix import NutrientMatrix
+
+    call_command('migrate', verbosity=0)
+    call_command('import_usda', engine='copy')
+
+    if models.NutrientData.objects.exists():
+        matrix = NutrientMatrix.from_database()
+    else:
+        ndb_nos = list(models.FoodDescription.objects.order_by('pk').values_list('pk', flat=True))
+        nutrient_numbers = ['%03d' % number for number in range(SYNTHETIC_NUTRIENTS)]
+        matrix = NutrientMatrix(ndb_nos, nutrient_numbers, synthetic_values(len(ndb_nos)))
+        print('Using synthetic nutrient values')
+
+    random.seed(28)
+    queries = []
+    for _ in range(QUERIES):
+        nutrients = random.sample(matrix.nutrient_numbers, 4)
+        constraints = {
+            '%s__%s' % (number, random.choice(['gt', 'lt'])): random.uniform(0.5, 2)
+            for number in nutrients[:random.randint(1, 3)]
+        }
+        queries.append((constraints, '-' + nutrients[3]))
+
+    timings = []
+    for constraints, order_by in queries:
+        start = time.perf_counter()
+        matrix.find(constraints, order_by=order_by, limit=20)
+        timings.append((time.perf_counter() - start) * 1e3)
+
+    print()
+    print('%d foods x %d nutrients' % (len(matrix.ndb_nos), len(matrix.nutrient_numbers)))
+    print('find(): p50 %.2f ms, p99 %.2f ms' % (percentile(timings, 0.5), percentile(timings, 0.99)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+End-to-end timings of `import_usda`, per input file and stage, for each
+engine. Results are written as JSON so that runs on different machines,
+backends or commits can be compared:
+
+    python -m benchmarks.import_usda --output before.json
+    python -m benchmarks.import_usda --baseline before.json
+
+With `--baseline`, files whose rows/sec dropped by more than `--tolerance`
+are reported and the exit status is 1. Files with fewer than `--min-rows` rows
+load too quickly to time reliably and are only printed.
+
+Each run is rolled back, so the database is left as it was.
+"""
+import argparse
+import json
+import platform
+import sys
+
+
+def environment():
+    import django
+    from django.db import connection
+
+    return {
+        'vendor': connection.vendor,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'platform': platform.platform(),
+    }
+
+
+def profile_import(engine, batch_size):
+    from django.db import transaction
+    from usda_nutrition.management.commands import import_usda
+
+    profile = import_usda.ImportProfile(batch_size, engine)
+    with transaction.atomic():
+        import_usda.run(batch_size=batch_size, engine=engine, profile=profile)
+        transaction.set_rollback(True)
+    return profile.as_dict()
+
+
+def best_runs(runs):
+    """
+    Keep the fastest result of each (engine, file) over repeated runs.
+    """
+    best = {}
+    for run in runs:
+        for info in run['files']:
+            key = (run['engine'], info['filename'])
+            if key not in best or info['rows_per_sec'] > best[key]['rows_per_sec']:
+                best[key] = info
+    return best
+
+
+def compare(results, baseline, tolerance, min_rows):
+    current, previous = best_runs(results['runs']), best_runs(baseline['runs'])
+    regressions = []
+    for key in sorted(current):
+        if key not in previous or not previous[key]['rows_per_sec']:
+            continue
+        change = current[key]['rows_per_sec'] / previous[key]['rows_per_sec'] - 1
+        print('%-5s %-14s %10d -> %10d rows/sec (%+.0f%%)' % (
+            key[0], key[1], previous[key]['rows_per_sec'], current[key]['rows_per_sec'], change * 100))
+        if change < -tolerance and current[key]['rows'] >= min_rows:
+            regressions.append(key)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--engine', action='append', help='Engine to run (default: all).')
+    parser.add_argument('--batch-size', type=int)
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per engine (default: 3).')
+    parser.add_argument('--output', help='Write the results as JSON to this file.')
+    parser.add_argument('--baseline', help='Compare against results written by an earlier run.')
+    parser.add_argument(
+        '--tolerance', type=float, default=0.1,
+        help='Fractional drop in rows/sec reported as a regression (default: 0.1).')
+    parser.add_argument(
+        '--min-rows', type=int, default=1000,
+        help='Smallest file checked for regressions (default: 1000 rows).')
+    args = parser.parse_args()
+
+    from benchmarks import setup
+    setup()
+    from django.core.management import call_command
+    from usda_nutrition.management.commands import import_usda
+
+    call_command('migrate', verbosity=0)
+    batch_size = args.batch_size or import_usda.DEFAULT_BATCH_SIZE
+    results = {'environment': environment(), 'runs': []}
+    for engine in args.engine or sorted(import_usda.ENGINES):
+        for _ in range(args.repeat):
+            results['runs'].append(profile_import(engine, batch_size))
+
+    print()
+    print('%-5s %-14s %8s %8s %8s %8s %10s %8s' % (
+        'engine', 'file', 'parse', 'convert', 'write', 'total', 'rows/sec', 'queries'))
+    for (engine, filename), info in sorted(best_runs(results['runs']).items()):
+        print('%-5s %-14s %8.3f %8.3f %8.3f %8.3f %10d %8d' % (
+            engine, filename, info['parse'], info['convert'], info['write'], info['seconds'],
+            info['rows_per_sec'], info['queries']))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['environment']['vendor'] != results['environment']['vendor']:
+            print('Warning: the baseline was recorded on %s.' % baseline['environment']['vendor'])
+        print()
+        regressions = compare(results, baseline, args.tolerance, args.min_rows)
+        if regressions:
+            print('Regressions: %s' % ', '.join('%s %s' % key for key in regressions))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Import time and on-disk size of the NutrientData table.
+
+NUT_DATA.txt isn't shipped with this package. Point `USDA_NUT_DATA` at the
+file from the SR28 release to benchmark the real data; otherwise a synthetic
+file of the same shape and size (~680k rows) is generated.
+
+To compare backends, set `USDA_BENCH_ENGINE` and `USDA_BENCH_DB` (see
+`benchmarks.setup()`), for example:
+
+    USDA_BENCH_ENGINE=django.db.backends.postgresql USDA_BENCH_DB=bench \
+        python -m benchmarks.nutrient_data
+
+Results for SQLite and PostgreSQL are recorded in `benchmarks/RESULTS.md`.
+"""
+import csv
+import os
+import random
+import tempfile
+import time
+
+from benchmarks import setup
+
+
+SYNTHETIC_NUTRIENTS_PER_FOOD = 77
+
+
+def synthesize(path, foods, nutrients):
+    random.seed(28)
+    with open(path, 'w', encoding='cp1252') as f:
+        for ndb_no in foods:
+            for nutrient_number in random.sample(nutrients, min(len(nutrients), SYNTHETIC_NUTRIENTS_PER_FOOD)):
+                f.write('~%s~^~%s~^%.3f^%d^%s^~1~^~~^~~^~~^^^^^^^~~^~11/1976~^\n' % (
+                    ndb_no, nutrient_number, random.uniform(0, 500),
+                    random.randint(0, 20), '%.3f' % random.uniform(0, 5)))
+
+
+def table_size(model_cls):
+    from django.db import connection
+
+    table = model_cls._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT pg_total_relation_size(%s)', [table])
+        else:
+            cursor.execute(
+                "SELECT SUM(pgsize) FROM dbstat WHERE name = %s OR name IN "
+                "(SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = %s)",
+                [table, table])
+        return cursor.fetchone()[0]
+
+
+def clear_table(model_cls):
+    """
+    Empty the table. On PostgreSQL, deleted rows would still count towards
+    its size, so it is truncated instead.
+    """
+    from django.db import connection
+
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('TRUNCATE %s' % connection.ops.quote_name(model_cls._meta.db_table))
+    else:
+        model_cls.objects.all().delete()
+
+
+def main():
+    setup()
+    from django.core.management import call_command
+    from django.db import connection, transaction
+    from usda_nutrition import models
+    from usda_nutrition.management.commands import import_usda
+
+    call_command('migrate', verbosity=0)
+    if not models.FoodDescription.objects.exists():
+        call_command('import_usda')
+
+    path = os.environ.get('USDA_NUT_DATA')
+    if not path:
+        path = os.path.join(tempfile.mkdtemp(), 'NUT_DATA.txt')
+        synthesize(
+            path,
+            list(models.FoodDescription.objects.values_list('ndb_no', flat=True)),
+            list(models.NutrientDefinition.objects.values_list('nutrient_number', flat=True)))
+        print('Using synthetic data in %s' % path)
+
+    info = [info for info in import_usda.input_files() if info['filename'] == 'NUT_DATA.txt'][0]
+    print('Backend: %s' % connection.vendor)
+    for engine in sorted(import_usda.ENGINES):
+        clear_table(models.NutrientData)
+        with open(path, encoding='cp1252') as f, transaction.atomic():
+            rows = csv.reader(f, delimiter='^', quotechar='~')
+            start = time.time()
+            count = import_usda.ENGINES[engine](
+                import_usda.build_tuples(rows, info['model'], info['fields']),
+                info['model'], info['fields'], import_usda.DEFAULT_BATCH_SIZE)
+            elapsed = time.time() - start
+        print('%-5s %d rows in %.1fs (%d rows/sec), table + indexes: %.1f MB' % (
+            engine, count, elapsed, count / elapsed, table_size(models.NutrientData) / 1e6))
+
+
+if __name__ == '__main__':
+    main()
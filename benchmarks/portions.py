@@ -0,0 +1,59 @@
+"""
+Cost of converting 100k `(ndb_no, quantity, unit)` items to grams with the
+in-memory portion index, versus one `Weight` query per item.
+"""
+import random
+import time
+
+from benchmarks import best_of, setup
+
+
+# Spellings a recipe parser might hand over, in addition to SR's own.
+VARIANTS = ['tbsp', 'Tablespoons', 'tsp', 'teaspoon', 'cups', 'oz', 'g', 'grams', 'fl oz', 'lb']
+CONVERSIONS = 100000
+
+
+def query_grams(ndb_no, quantity, unit):
+    from usda_nutrition import models
+
+    weight = models.Weight.objects.filter(
+        food_description_id=ndb_no, measure_description=unit).order_by('sequence').first()
+    return quantity * float(weight.gram_weight) / float(weight.amount) if weight else None
+
+
+def main():
+    setup()
+    from django.core.management import call_command
+    from usda_nutrition import models
+    from usda_nutrition.portions import PortionIndex
+
+    call_command('migrate', verbosity=0)
+    call_command('import_usda', engine='copy')
+
+    weights = list(models.Weight.objects.values_list('food_description_id', 'measure_description'))
+    random.seed(28)
+    items = []
+    for _ in range(CONVERSIONS):
+        ndb_no, description = random.choice(weights)
+        unit = description if random.random() < 0.5 else random.choice(VARIANTS)
+        items.append((ndb_no, random.randint(1, 4), unit))
+
+    start = time.time()
+    index = PortionIndex.from_database()
+    build_time = time.time() - start
+    convert_time = best_of(lambda: index.to_grams(items), 1)
+    converted = sum(grams is not None for grams in index.to_grams(items))
+
+    sample = items[:1000]
+    query_time = best_of(lambda: [query_grams(*item) for item in sample], 1, repeat=3) / len(sample) * len(items)
+
+    print()
+    print('Index build:                %8.1f ms' % (build_time * 1e3))
+    print('%dk conversions (index):   %8.1f ms (%.1f%% converted)' % (
+        CONVERSIONS // 1000, convert_time * 1e3, converted * 100.0 / len(items)))
+    print('%dk conversions (queries): %8.1f ms (extrapolated from %d)' % (
+        CONVERSIONS // 1000, query_time * 1e3, len(sample)))
+
+
+if __name__ == '__main__':
+    main()
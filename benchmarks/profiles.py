@@ -0,0 +1,79 @@
+"""
+Cost of serving a food detail response: building the JSON from the ORM with
+`aio.load_foods()`'s prefetches, versus `get_profile()` on a warm cache and
+reading straight from `FoodProfile`. The profiles are cached in a local
+memory cache big enough to hold them all.
+"""
+import json
+import random
+
+from benchmarks import best_of, setup
+
+
+LOOKUPS = 1000
+
+
+def serialize(food):
+    return json.dumps({
+        'ndb_no': food.ndb_no,
+        'long_desc': food.long_desc,
+        'short_desc': food.short_desc,
+        'food_group': {'code': food.food_group.code, 'description': food.food_group.description},
+        'weights': [
+            {'sequence': weight.sequence, 'amount': float(weight.amount),
+             'measure_description': weight.measure_description, 'gram_weight': float(weight.gram_weight)}
+            for weight in food.weights.all()
+        ],
+        'footnotes': [
+            {'footnote_no': footnote.footnote_no, 'footnote_type': footnote.footnote_type,
+             'nutrient_number': footnote.nutrient_definition_id, 'footnote_text': footnote.footnote_text}
+            for footnote in food.footnotes.all()
+        ],
+        'nutrients': [
+            {'nutrient_number': data.nutrient_definition_id, 'tagname': data.nutrient_definition.tagname,
+             'value': float(data.nutrient_value)}
+            for data in food.nutrient_data.all()
+        ],
+    }).encode('utf-8')
+
+
+def main():
+    setup()
+    from django.core.management import call_command
+    from django.test.utils import override_settings
+    from usda_nutrition import models
+    from usda_nutrition.aio import load_foods
+    from usda_nutrition.profiles import get_cache, get_profile
+
+    call_command('migrate', verbosity=0)
+    call_command('import_usda', engine='copy')
+    override_settings(CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        },
+    }).enable()
+
+    random.seed(28)
+    ndb_nos = random.sample(list(models.FoodDescription.objects.values_list('pk', flat=True)), LOOKUPS)
+
+    orm_time = best_of(lambda: [serialize(load_foods([ndb_no])[ndb_no]) for ndb_no in ndb_nos], 1, repeat=3)
+
+    def uncached():
+        get_cache().clear()
+        return [get_profile(ndb_no) for ndb_no in ndb_nos]
+
+    table_time = best_of(uncached, 1, repeat=3)
+    [get_profile(ndb_no) for ndb_no in ndb_nos]
+    cached_time = best_of(lambda: [get_profile(ndb_no) for ndb_no in ndb_nos], 1)
+
+    size = sum(len(data) for data in models.FoodProfile.objects.values_list('data', flat=True))
+    print()
+    print('Profiles stored:         %8d (%.1f MB)' % (models.FoodProfile.objects.count(), size / 1e6))
+    print('ORM + serialize:         %8.1f us/lookup' % (orm_time / LOOKUPS * 1e6))
+    print('get_profile (table):     %8.1f us/lookup' % (table_time / LOOKUPS * 1e6))
+    print('get_profile (cached):    %8.1f us/lookup' % (cached_time / LOOKUPS * 1e6))
+
+
+if __name__ == '__main__':
+    main()
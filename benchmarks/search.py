@@ -0,0 +1,75 @@
+"""
+Latency of `search_foods()` on the full SR28 food list, per backend.
+
+Queries are one to three words drawn from real food descriptions, some of
+them truncated to exercise prefix matching. Queries with no terms (such as
+"and") are skipped.
+"""
+import collections
+import random
+import time
+
+from benchmarks import setup
+
+
+QUERIES = 2000
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def make_queries(descriptions):
+    from usda_nutrition.search import tokenize
+
+    random.seed(28)
+    queries = []
+    for _ in range(QUERIES):
+        words = random.choice(descriptions).replace(',', ' ').split()
+        query = random.sample(words, min(len(words), random.randint(1, 3)))
+        if random.random() < 0.3:
+            query[-1] = query[-1][:max(3, len(query[-1]) - 2)]
+        queries.append(' '.join(query))
+    return [query for query in queries if tokenize(query)]
+
+
+def main():
+    setup()
+    from django.core.management import call_command
+    from django.db import connection
+    from django.test.utils import override_settings
+    from usda_nutrition import models, search
+
+    call_command('migrate', verbosity=0)
+    call_command('import_usda', engine='copy')
+    queries = make_queries(list(models.FoodDescription.objects.values_list('long_desc', flat=True)))
+
+    backends = ['python']
+    if connection.vendor in search.BACKENDS and search.search_table_exists():
+        backends.append(connection.vendor)
+
+    # "ranking" is the backend alone; "search_foods" adds tokenizing the
+    # query and fetching the FoodDescription rows.
+    print()
+    print('%-10s %-12s %8s %8s %8s' % ('backend', 'stage', 'p50 ms', 'p99 ms', 'max ms'))
+    for backend in backends:
+        with override_settings(USDA_NUTRITION_SEARCH_BACKEND=backend):
+            search.search_foods('warm up')
+            ranking, total = [], []
+            for query in queries:
+                tokens = list(collections.OrderedDict.fromkeys(search.tokenize(query)))
+                start = time.perf_counter()
+                search.get_backend().search(tokens, 20)
+                ranking.append((time.perf_counter() - start) * 1e3)
+
+                start = time.perf_counter()
+                search.search_foods(query, limit=20)
+                total.append((time.perf_counter() - start) * 1e3)
+        for stage, timings in [('ranking', ranking), ('search_foods', total)]:
+            print('%-10s %-12s %8.2f %8.2f %8.2f' % (
+                backend, stage, percentile(timings, 0.5), percentile(timings, 0.99), max(timings)))
+
+
+if __name__ == '__main__':
+    main()
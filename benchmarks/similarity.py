@@ -0,0 +1,81 @@
+"""
+Latency of nearest-neighbour searches over nutrient profiles at SR28's size.
+
+If the database has no nutrient values (NUT_DATA.txt isn't shipped), a
+synthetic matrix with SR28's shape and sparsity is used instead.
+"""
+import random
+import time
+
+import numpy as np
+
+from benchmarks import setup
+from benchmarks.search import percentile
+
+
+SEARCHES = 1000
+SYNTHETIC_NUTRIENTS = 150
+SYNTHETIC_DENSITY = 0.5
+
+
+def synthetic_values(foods):
+    generator = np.random.RandomState(28)
+    values = generator.lognormal(size=(foods, SYNTHETIC_NUTRIENTS))
+    values[generator.random_sample(values.shape) > SYNTHETIC_DENSITY] = 0
+    return values
+
+
+def main():
+    setup()
+    from django.core.management import call_command
+    from usda_nutrition import models
+    from usda_nutrition.matrix import NutrientMatrix
+    from usda_nutrition.similarity import ENERGY_KCAL, SimilarityIndex, similar_foods
+    from usda_nutrition import similarity
+
+    call_command('migrate', verbosity=0)
+    call_command('import_usda', engine='copy')
+
+    start = time.perf_counter()
+    if models.NutrientData.objects.exists():
+        index = SimilarityIndex.from_matrix(NutrientMatrix.from_database())
+    else:
+        foods = list(models.FoodDescription.objects.order_by('pk').values_list('pk', 'food_group_id'))
+        nutrient_numbers = [ENERGY_KCAL] + ['%03d' % number for number in range(SYNTHETIC_NUTRIENTS - 1)]
+        index = SimilarityIndex(
+            [ndb_no for ndb_no, _ in foods], nutrient_numbers, [group for _, group in foods],
+            synthetic_values(len(foods)))
+        print('Using synthetic nutrient values')
+    build_time = time.perf_counter() - start
+    similarity.get_similarity_index = lambda: index
+
+    random.seed(28)
+    sample = [random.choice(index.ndb_nos) for _ in range(SEARCHES)]
+    groups = sorted(set(index.food_groups.tolist()))
+    cases = [
+        ('all nutrients', lambda ndb_no: index.similar(ndb_no, 10)),
+        ('per kcal', lambda ndb_no: index.similar(ndb_no, 10, basis='kcal')),
+        ('food group', lambda ndb_no: index.similar(ndb_no, 10, food_group=random.choice(groups))),
+        ('8 nutrients', lambda ndb_no: index.similar(ndb_no, 10, nutrients=index.nutrient_numbers[:8])),
+        ('similar_foods', lambda ndb_no: similar_foods(ndb_no, 10)),
+    ]
+
+    print()
+    print('Index build: %.1f ms (%d foods x %d nutrients)' % (
+        build_time * 1e3, len(index.ndb_nos), len(index.nutrient_numbers)))
+    print('%-14s %8s %8s' % ('search', 'p50 ms', 'p99 ms'))
+    for name, search in cases:
+        timings = []
+        for ndb_no in sample:
+            start = time.perf_counter()
+            try:
+                search(ndb_no)
+            except ValueError:
+                # No energy value to normalize by.
+                continue
+            timings.append((time.perf_counter() - start) * 1e3)
+        print('%-14s %8.2f %8.2f' % (name, percentile(timings, 0.5), percentile(timings, 0.99)))
+
+
+if __name__ == '__main__':
+    main()
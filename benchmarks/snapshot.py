@@ -0,0 +1,46 @@
+"""
+Startup cost for a read-only consumer: running `import_usda` into a fresh
+database, versus opening a binary snapshot, and the cost of lookups by
+`ndb_no` in the snapshot.
+"""
+import os
+import random
+import tempfile
+import time
+
+from benchmarks import best_of, setup
+
+
+def main():
+    setup()
+    from django.core.management import call_command
+    from usda_nutrition.snapshot import Snapshot, write_snapshot
+
+    call_command('migrate', verbosity=0)
+    start = time.time()
+    call_command('import_usda', engine='copy')
+    import_time = time.time() - start
+
+    path = os.path.join(tempfile.mkdtemp(), 'sr28.snapshot')
+    write_snapshot(path)
+
+    open_time = best_of(lambda: Snapshot(path).close(), 100)
+    with Snapshot(path) as snapshot:
+        ndb_nos = snapshot.ndb_nos()
+        random.seed(28)
+        sample = [random.choice(ndb_nos) for _ in range(1000)]
+        food_time = best_of(lambda: [snapshot.food(ndb_no) for ndb_no in sample], 1) / len(sample)
+        detail_time = best_of(lambda: [
+            (snapshot.food(ndb_no), snapshot.weights(ndb_no), snapshot.footnotes(ndb_no), snapshot.nutrients(ndb_no))
+            for ndb_no in sample
+        ], 1) / len(sample)
+
+    print()
+    print('import_usda (copy engine): %8.1f ms' % (import_time * 1e3))
+    print('Snapshot open:             %8.3f ms (%.1f MB)' % (open_time * 1e3, os.path.getsize(path) / 1e6))
+    print('food() lookup:             %8.1f us' % (food_time * 1e6))
+    print('food + related rows:       %8.1f us' % (detail_time * 1e6))
+
+
+if __name__ == '__main__':
+    main()
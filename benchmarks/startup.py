@@ -0,0 +1,67 @@
+"""
+Cold-start cost of installing `usda_nutrition`: the time `django.setup()`
+takes and the memory it allocates (traced by `tracemalloc`), with and without
+the app in `INSTALLED_APPS`, and of importing the `import_usda` command.
+
+Each measurement runs in a fresh interpreter; the best of several runs is
+reported.
+"""
+import json
+import subprocess
+import sys
+
+
+RUNS = 7
+
+BASE_APPS = [
+    'django.contrib.admin',
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.messages',
+    'django.contrib.sessions',
+]
+
+SCRIPT = '''
+import json, sys, time, tracemalloc
+tracemalloc.start()
+start = time.perf_counter()
+import django
+from django.conf import settings
+settings.configure(
+    DATABASES={'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': ':memory:'}},
+    INSTALLED_APPS=%(apps)r,
+)
+django.setup()
+setup_time = time.perf_counter() - start
+setup_memory = tracemalloc.get_traced_memory()[0]
+start = time.perf_counter()
+%(extra)s
+extra_time = time.perf_counter() - start
+extra_memory = tracemalloc.get_traced_memory()[0] - setup_memory
+print(json.dumps([setup_time, setup_memory, extra_time, extra_memory]))
+'''
+
+
+def measure(apps, extra='pass'):
+    runs = []
+    for _ in range(RUNS):
+        output = subprocess.check_output([sys.executable, '-c', SCRIPT % {'apps': apps, 'extra': extra}])
+        runs.append(json.loads(output.decode('utf-8')))
+    return [min(run[index] for run in runs) for index in range(4)]
+
+
+def main():
+    without_app = measure(BASE_APPS)
+    with_app = measure(BASE_APPS + ['usda_nutrition'], 'from django.contrib import admin; admin.autodiscover()\n'
+                       'from usda_nutrition.management.commands import import_usda')
+
+    print('%-36s %9s %9s' % ('', 'ms', 'MB'))
+    print('%-36s %9.1f %9.2f' % ('django.setup() without the app', without_app[0] * 1e3, without_app[1] / 1e6))
+    print('%-36s %9.1f %9.2f' % ('django.setup() with the app', with_app[0] * 1e3, with_app[1] / 1e6))
+    print('%-36s %9.1f %9.2f' % (
+        'added by the app', (with_app[0] - without_app[0]) * 1e3, (with_app[1] - without_app[1]) / 1e6))
+    print('%-36s %9.1f %9.2f' % ('admin + import_usda command', with_app[2] * 1e3, with_app[3] / 1e6))
+
+
+if __name__ == '__main__':
+    main()
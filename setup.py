@@ -12,8 +12,11 @@ def readme():
 setup(
     name='django-usda-nutrition',
     version=__version__,
-    packages=find_packages(exclude=('tests*',)),
+    packages=find_packages(exclude=('tests*', 'benchmarks*')),
     include_package_data=True,
+    extras_require={
+        'matrix': ['numpy'],
+    },
     author='Daniel Naab',
     author_email='dan@crushingpennies.com',
     description='Django application for working with the USDA nutrition database.',
@@ -0,0 +1,56 @@
+"""
+Small, hand-made datasets for tests that need nutrient values, which aren't
+part of the data shipped with this package.
+"""
+from usda_nutrition import cache, models
+
+
+# Nutrient values per 100 g: {ndb_no: {nutrient_number: value}}. Cheddar has
+# no fibre value, as SR foods often lack some nutrients.
+NUTRIENT_VALUES = {
+    '01001': {'203': 0.85, '204': 81.11, '208': 717, '291': 0},
+    '01009': {'203': 22.87, '204': 33.31, '208': 404},
+    '09003': {'203': 0.26, '204': 0.17, '208': 52, '291': 2.4},
+    '11090': {'203': 2.82, '204': 0.37, '208': 34, '291': 2.6},
+}
+
+
+def create_nutrient_data():
+    models.SourceCode.objects.create(source_code='1', description='Analytical')
+    dairy = models.FoodGroup.objects.create(code='0100', description='Dairy and Egg Products')
+    fruits = models.FoodGroup.objects.create(code='0900', description='Fruits and Fruit Juices')
+    vegetables = models.FoodGroup.objects.create(code='1100', description='Vegetables and Vegetable Products')
+    for number, tagname, units, description, sort_order in [
+            ('203', 'PROCNT', 'g', 'Protein', 600),
+            ('204', 'FAT', 'g', 'Total lipid (fat)', 800),
+            ('208', 'ENERC_KCAL', 'kcal', 'Energy', 300),
+            ('291', 'FIBTG', 'g', 'Fiber, total dietary', 1200)]:
+        models.NutrientDefinition.objects.create(
+            nutrient_number=number, tagname=tagname, units=units, nutrient_description=description,
+            num_decimal_places='2', sort_order=sort_order)
+    for ndb_no, group, long_desc, short_desc in [
+            ('01001', dairy, 'Butter, salted', 'BUTTER,WITH SALT'),
+            ('01009', dairy, 'Cheese, cheddar', 'CHEESE,CHEDDAR'),
+            ('09003', fruits, 'Apples, raw, with skin', 'APPLES,RAW,WITH SKIN'),
+            ('11090', vegetables, 'Broccoli, raw', 'BROCCOLI,RAW')]:
+        models.FoodDescription.objects.create(
+            ndb_no=ndb_no, food_group=group, long_desc=long_desc, short_desc=short_desc)
+    models.NutrientData.objects.bulk_create([
+        models.NutrientData(
+            food_description_id=ndb_no, nutrient_definition_id=number, nutrient_value=value,
+            number_data_points=1, source_code_id='1')
+        for ndb_no, values in NUTRIENT_VALUES.items()
+        for number, value in values.items()
+    ])
+
+
+class NutrientDataMixin(object):
+    """
+    Create the dataset above for each test, and drop the process-wide caches
+    and data built from the tables before and after it.
+    """
+    def setUp(self):
+        super(NutrientDataMixin, self).setUp()
+        create_nutrient_data()
+        cache.invalidate_all()
+        self.addCleanup(cache.invalidate_all)
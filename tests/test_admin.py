@@ -0,0 +1,80 @@
+from django.contrib.admin import AdminSite
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from usda_nutrition import admin, models
+
+from .factories import NutrientDataMixin
+
+
+class TestAdminChangelists(NutrientDataMixin, TestCase):
+    def setUp(self):
+        super(TestAdminChangelists, self).setUp()
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+
+    def create_rows(self, ndb_no, count):
+        food = models.FoodDescription.objects.get(pk=ndb_no)
+        start = food.weights.count()
+        models.Weight.objects.bulk_create([
+            models.Weight(
+                food_description=food, sequence=start + index + 1, amount=1,
+                measure_description='serving %d' % index, gram_weight=100)
+            for index in range(count)
+        ])
+        models.Footnote.objects.bulk_create([
+            models.Footnote(food_description=food, footnote_no='%02d' % index, footnote_type='D', footnote_text='Note')
+            for index in range(count)
+        ])
+
+    def changelist_queries(self, model_name, params=None):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/admin/usda_nutrition/%s/' % model_name, params or {})
+        self.assertEqual(response.status_code, 200)
+        return len(context), response
+
+    def assertBoundedQueries(self, model_name, params=None):
+        # Warm the reference data cache used by the food group filter.
+        self.changelist_queries(model_name, params)
+        self.create_rows('01001', 2)
+        few, _ = self.changelist_queries(model_name, params)
+        self.create_rows('01009', 20)
+        many, response = self.changelist_queries(model_name, params)
+        self.assertEqual(few, many)
+        # Session, user, result count, full count (small tables only) and results.
+        self.assertLessEqual(many, 5)
+        return response
+
+    def test_food_description(self):
+        self.assertBoundedQueries('fooddescription')
+
+    def test_weight(self):
+        response = self.assertBoundedQueries('weight')
+        self.assertContains(response, 'BUTTER,WITH SALT')
+
+    def test_footnote(self):
+        self.assertBoundedQueries('footnote')
+
+    def test_nutrient_data(self):
+        self.assertBoundedQueries('nutrientdata')
+
+    def test_food_group_filter(self):
+        response = self.assertBoundedQueries('weight', {'food_group': '0100'})
+        self.assertEqual(response.context['cl'].result_count, 22)
+        _, response = self.changelist_queries('weight', {'food_group': '0900'})
+        self.assertEqual(response.context['cl'].result_count, 0)
+
+    def test_search(self):
+        _, response = self.changelist_queries('fooddescription', {'q': 'cheddar'})
+        self.assertEqual([food.pk for food in response.context['cl'].result_list], ['01009'])
+        _, response = self.changelist_queries('nutrientdata', {'q': '1001'})
+        self.assertEqual(response.context['cl'].result_count, 4)
+
+
+class TestRegister(TestCase):
+    def test_register_on_site(self):
+        site = AdminSite(name='usda')
+        admin.register(site)
+        self.assertIsInstance(site._registry[models.Weight], admin.WeightAdmin)
+        self.assertEqual(len(site._registry), len(admin.MODEL_ADMINS))
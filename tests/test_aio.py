@@ -0,0 +1,98 @@
+import asyncio
+from concurrent.futures import Executor, Future
+from unittest import mock
+
+from django.test import TestCase, TransactionTestCase
+
+from usda_nutrition import aio, models
+
+from .factories import NutrientDataMixin
+
+
+class InlineExecutor(Executor):
+    """
+    Runs batches in the test's thread, where its connection and transaction
+    (and assertNumQueries) apply.
+    """
+    def submit(self, fn, *args, **kwargs):
+        future = Future()
+        future.set_result(fn(*args, **kwargs))
+        return future
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+class AsyncTestMixin(NutrientDataMixin):
+    def setUp(self):
+        super(AsyncTestMixin, self).setUp()
+        models.Weight.objects.create(
+            food_description_id='01001', sequence=1, amount=1, measure_description='pat', gram_weight=5)
+        # Warm the reference data cache.
+        models.NutrientDefinition.cached.as_dict()
+        models.FoodGroup.cached.as_dict()
+        models.SourceCode.cached.as_dict()
+
+
+class TestCoalescing(AsyncTestMixin, TestCase):
+    def setUp(self):
+        super(TestCoalescing, self).setUp()
+        patcher = mock.patch.object(aio, 'executor', InlineExecutor())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_get_food(self):
+        with self.assertNumQueries(4):
+            food = run(aio.get_food('01001'))
+        with self.assertNumQueries(0):
+            self.assertEqual(food.food_group.description, 'Dairy and Egg Products')
+            self.assertEqual([weight.measure_description for weight in food.weights.all()], ['pat'])
+            self.assertEqual(
+                [row.nutrient_definition.tagname for row in food.nutrient_data.all()],
+                ['ENERC_KCAL', 'PROCNT', 'FAT', 'FIBTG'])
+        with self.assertRaises(models.FoodDescription.DoesNotExist):
+            run(aio.get_food('99999'))
+
+    def test_concurrent_lookups_are_coalesced(self):
+        async def lookups():
+            ndb_nos = ['01001', '01009', '09003', '11090', '99999'] * 20
+            return await asyncio.gather(
+                aio.get_foods(ndb_nos[:50]),
+                aio.get_foods(ndb_nos[50:]),
+                *[aio.get_food(ndb_no) for ndb_no in ndb_nos if ndb_no != '99999'])
+
+        # One query for the foods and one per prefetched relation, for all
+        # 180 lookups.
+        with self.assertNumQueries(4):
+            results = run(lookups())
+        self.assertEqual([food and food.pk for food in results[0][:5]], ['01001', '01009', '09003', '11090', None])
+        self.assertEqual(len(results), 82)
+        self.assertIs(results[2], results[0][0])
+
+    def test_separate_ticks_are_separate_batches(self):
+        async def lookups():
+            await aio.get_food('01001')
+            await aio.get_food('01009')
+
+        with self.assertNumQueries(8):
+            run(lookups())
+
+    def test_search(self):
+        async def searches():
+            return await asyncio.gather(*[aio.search_foods('cheddar') for _ in range(10)])
+
+        results = run(searches())
+        self.assertEqual([food.pk for food in results[0]], ['01009'])
+        self.assertIs(results[9], results[0])
+
+
+class TestThreadPool(AsyncTestMixin, TransactionTestCase):
+    def test_get_foods(self):
+        foods = run(aio.get_foods(['09003', '01001']))
+        self.assertEqual([food.pk for food in foods], ['09003', '01001'])
+        self.assertEqual(len(foods[1].nutrient_data.all()), 4)
@@ -0,0 +1,44 @@
+from django.test import TestCase, override_settings
+
+from usda_nutrition import cache, models
+from usda_nutrition.signals import data_imported
+
+from .factories import NutrientDataMixin
+
+
+class TestCachedLookup(NutrientDataMixin, TestCase):
+    def test_reads_through_once(self):
+        with self.assertNumQueries(2):
+            protein = models.NutrientDefinition.cached.get('203')
+        self.assertEqual(protein.tagname, 'PROCNT')
+        with self.assertNumQueries(0):
+            self.assertIs(models.NutrientDefinition.cached.get('203'), protein)
+            self.assertEqual(len(models.NutrientDefinition.cached.as_dict()), 4)
+            with self.assertRaises(models.NutrientDefinition.DoesNotExist):
+                models.NutrientDefinition.cached.get('999')
+
+    def test_mapping_is_immutable(self):
+        with self.assertRaises(TypeError):
+            models.FoodGroup.cached.as_dict()['9900'] = None
+
+    def test_attach_references(self):
+        models.FoodGroup.cached.as_dict()
+        food = models.FoodDescription.objects.get(pk='01001')
+        with self.assertNumQueries(0):
+            cache.attach_references([food])
+            self.assertEqual(food.food_group.description, 'Dairy and Egg Products')
+
+    def test_invalidated_by_signal(self):
+        models.FoodGroup.cached.as_dict()
+        models.FoodGroup.objects.create(code='0200', description='Spices and Herbs')
+        data_imported.send(sender=models.DataVersion, version=1)
+        self.assertEqual(models.FoodGroup.cached.get('0200').description, 'Spices and Herbs')
+
+    @override_settings(USDA_NUTRITION_CACHE_TIMEOUT=0)
+    def test_invalidated_by_version_stamp(self):
+        models.FoodGroup.cached.as_dict()
+        models.FoodGroup.objects.create(code='0200', description='Spices and Herbs')
+        with self.assertRaises(models.FoodGroup.DoesNotExist):
+            models.FoodGroup.cached.get('0200')
+        models.DataVersion.objects.create(pk=1, version=1)
+        self.assertEqual(models.FoodGroup.cached.get('0200').description, 'Spices and Herbs')
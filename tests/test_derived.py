@@ -0,0 +1,64 @@
+from decimal import Decimal
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from usda_nutrition import derived, models
+
+from .factories import create_nutrient_data
+
+
+class TestFoodValues(TestCase):
+    def setUp(self):
+        create_nutrient_data()
+        models.NutrientDefinition.objects.create(
+            nutrient_number='205', tagname='CHOCDF', units='g', nutrient_description='Carbohydrate, by difference',
+            num_decimal_places='2', sort_order=1110)
+        models.NutrientData.objects.create(
+            food_description_id='09003', nutrient_definition_id='205', nutrient_value=Decimal('13.81'),
+            number_data_points=1, source_code_id='1')
+        models.FoodDescription.objects.filter(pk='09003').update(
+            refuse=10, protein_factor=Decimal('3.36'), fat_factor=Decimal('8.37'), cho_factor=Decimal('3.60'))
+        models.Weight.objects.create(
+            food_description_id='09003', sequence=1, amount=1, measure_description='cup, quartered or chopped',
+            gram_weight=Decimal('125.0'))
+
+    def test_update_food_values(self):
+        derived.update_food_values()
+        apple = models.FoodDescription.objects.get(pk='09003')
+        # 3.36 * 0.26 + 8.37 * 0.17 + 3.60 * 13.81
+        self.assertEqual(apple.energy_kcal, Decimal('52.01'))
+        self.assertEqual(apple.edible_fraction, Decimal('0.900'))
+        self.assertEqual(apple.serving_grams, Decimal('125.0'))
+
+        # Without factors, the reported energy is used.
+        butter = models.FoodDescription.objects.get(pk='01001')
+        self.assertEqual(butter.energy_kcal, 717)
+        self.assertIsNone(butter.edible_fraction)
+        self.assertIsNone(butter.serving_grams)
+
+    def test_only_changed_foods_written(self):
+        self.assertEqual(derived.update_food_values(), 4)
+        self.assertEqual(derived.update_food_values(), 0)
+        models.FoodDescription.objects.filter(pk='09003').update(refuse=20)
+        self.assertEqual(derived.update_food_values(), 1)
+        self.assertEqual(models.FoodDescription.objects.get(pk='09003').edible_fraction, Decimal('0.800'))
+
+    def test_sortable(self):
+        derived.update_food_values()
+        self.assertEqual(
+            list(models.FoodDescription.objects.order_by('energy_kcal').values_list('pk', flat=True)),
+            ['11090', '09003', '01009', '01001'])
+
+
+class TestImportedFoodValues(TestCase):
+    def test_import(self):
+        call_command('import_usda')
+        broccoli = models.FoodDescription.objects.get(pk='11090')
+        self.assertEqual(broccoli.refuse_description, 'Leaves and tough stalks with trimmings')
+        self.assertEqual(broccoli.scientific_name, 'Brassica oleracea var. italica')
+        self.assertIsNone(broccoli.nitrogen_factor)
+        self.assertEqual(broccoli.cho_factor, Decimal('3.57'))
+        self.assertEqual(broccoli.edible_fraction, Decimal('0.610'))
+        butter = models.FoodDescription.objects.get(pk='01001')
+        self.assertEqual(butter.serving_grams, Decimal('5.0'))
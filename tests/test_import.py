@@ -1,5 +1,22 @@
-from django.core.management import call_command
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import zipfile
+from decimal import Decimal
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, reset_queries
+from django.test import TestCase, TransactionTestCase
+
+from usda_nutrition import models
+from usda_nutrition.management.commands import import_usda
+from usda_nutrition.sources import get_source, package_data_dir
 
 
 class TestImportCommand(TestCase):
@@ -10,3 +27,311 @@ class TestImportCommand(TestCase):
         TODO: Don't be so stupid.
         """
         call_command('import_usda')
+
+    def test_small_batches(self):
+        """
+        Rows are flushed in batches; every row should still be imported.
+        """
+        call_command('import_usda', batch_size=100)
+        self.assertEqual(models.FoodDescription.objects.count(), 8789)
+        self.assertEqual(models.Weight.objects.count(), 15438)
+
+    def test_bumps_data_version(self):
+        call_command('import_usda', mode='sync')
+        self.assertEqual(models.DataVersion.objects.get().version, 1)
+        models.Weight.objects.filter(food_description_id='01001', sequence=1).update(gram_weight='99.9')
+        call_command('import_usda', mode='sync')
+        self.assertEqual(models.DataVersion.objects.get().version, 2)
+
+    def test_sync_without_changes(self):
+        """
+        A sync that changes nothing skips the post-import stages.
+        """
+        call_command('import_usda')
+        with mock.patch.object(import_usda, 'post_import') as post_import, \
+                mock.patch.object(import_usda.data_imported, 'send') as send:
+            call_command('import_usda', mode='sync')
+        post_import.assert_not_called()
+        send.assert_not_called()
+        self.assertEqual(models.DataVersion.objects.get().version, 1)
+
+
+class TestPostCommitStages(TransactionTestCase):
+    def test_files_written_after_commit(self):
+        in_transaction = []
+
+        def save():
+            in_transaction.append(connection.in_atomic_block)
+
+        with mock.patch.object(import_usda, 'save_nutrient_matrix', save), \
+                mock.patch.object(import_usda, 'save_similarity_index', save):
+            call_command('import_usda')
+        self.assertEqual(in_transaction, [False, False])
+
+
+def dump_tables():
+    return {
+        info['filename']: list(
+            info['model'].objects.order_by('pk').values_list(*info['fields']))
+        for info in import_usda.input_files()
+    }
+
+
+def sorted_tables():
+    return {filename: sorted(rows, key=repr) for filename, rows in dump_tables().items()}
+
+
+class TestImportEngines(TestCase):
+
+    def test_engines_produce_identical_tables(self):
+        call_command('import_usda', engine='orm')
+        orm_tables = dump_tables()
+
+        for info in reversed(import_usda.input_files()):
+            info['model'].objects.all().delete()
+
+        call_command('import_usda', engine='copy')
+        self.assertEqual(dump_tables(), orm_tables)
+
+    def test_parallel_import_matches_serial(self):
+        call_command('import_usda')
+        serial_tables = dump_tables()
+
+        for info in reversed(import_usda.input_files()):
+            info['model'].objects.all().delete()
+
+        call_command('import_usda', jobs=2)
+        self.assertEqual(dump_tables(), serial_tables)
+
+    def test_parallel_import_with_spawned_workers(self):
+        call_command('import_usda')
+        serial_tables = dump_tables()
+
+        for info in reversed(import_usda.input_files()):
+            info['model'].objects.all().delete()
+
+        # "spawn" is the default start method on macOS and Windows.
+        start_method = multiprocessing.get_start_method()
+        multiprocessing.set_start_method('spawn', force=True)
+        try:
+            call_command('import_usda', jobs=2)
+        finally:
+            multiprocessing.set_start_method(start_method, force=True)
+        self.assertEqual(dump_tables(), serial_tables)
+
+        for info in reversed(import_usda.input_files()):
+            info['model'].objects.all().delete()
+
+        # Where fork isn't available at all, files are parsed in this process.
+        with mock.patch('multiprocessing.get_all_start_methods', return_value=['spawn']):
+            call_command('import_usda', jobs=2)
+        self.assertEqual(dump_tables(), serial_tables)
+
+
+class TestDependencyLayers(TestCase):
+    def test_layers_follow_foreign_keys(self):
+        layers = import_usda.dependency_layers(import_usda.input_files())
+        self.assertEqual(
+            [[info['filename'] for info in layer] for layer in layers], [
+                ['DERIV_CD.txt', 'FD_GROUP.txt', 'SRC_CD.txt', 'NUTR_DEF.txt'],
+                ['FOOD_DES.txt'],
+                ['WEIGHT.txt', 'FOOTNOTE.txt', 'NUT_DATA.txt'],
+            ])
+
+
+class TestNutrientData(TestCase):
+    ROWS = [
+        '~01001~^~203~^0.85^16^0.074^~1~^~~^~~^~~^^^^^^^~~^~11/1976~^',
+        '~01001~^~204~^81.11^580^0.065^~1~^~~^~~^~~^^^^^^^~~^~11/1976~^',
+    ]
+
+    def test_load_nutrient_data(self):
+        call_command('import_usda')
+        info = [info for info in import_usda.input_files() if info['filename'] == 'NUT_DATA.txt'][0]
+        rows = csv.reader(self.ROWS, delimiter='^', quotechar='~')
+        values = import_usda.build_tuples(rows, models.NutrientData, info['fields'])
+
+        import_usda.load_file(info['filename'], info['model'], info['fields'], values, engine='copy')
+
+        food = models.FoodDescription.objects.get(ndb_no='01001')
+        self.assertEqual(
+            list(food.nutrient_data.order_by('nutrient_definition').values_list(
+                'nutrient_definition__tagname', 'nutrient_value', 'number_data_points', 'minimum')),
+            [('PROCNT', Decimal('0.850'), 16, None), ('FAT', Decimal('81.110'), 580, None)])
+
+
+class TestSyncMode(TestCase):
+    def test_sync_into_empty_tables(self):
+        call_command('import_usda', mode='sync')
+        self.assertEqual(models.FoodDescription.objects.count(), 8789)
+        self.assertEqual(models.Weight.objects.count(), 15438)
+
+    def test_sync_applies_only_changes(self):
+        call_command('import_usda')
+        imported = sorted_tables()
+
+        weight = models.Weight.objects.get(food_description_id='01001', sequence=1)
+        models.Weight.objects.filter(pk=weight.pk).update(gram_weight='99.9')
+        models.Weight.objects.filter(food_description_id='01001', sequence=2).delete()
+        models.DerivationCode.objects.create(code='ZZ', description='Not in SR28')
+        food = models.FoodDescription.objects.create(
+            ndb_no='99999', food_group_id='0100', long_desc='Not in SR28', short_desc='NOT IN SR28')
+        models.Weight.objects.create(
+            food_description=food, sequence=1, amount=1, measure_description='cup', gram_weight=1)
+        untouched_pk = models.Weight.objects.get(food_description_id='01001', sequence=3).pk
+
+        call_command('import_usda', mode='sync')
+
+        self.assertEqual(sorted_tables(), imported)
+        # Unchanged rows are left alone, and updated rows keep their identity.
+        self.assertEqual(models.Weight.objects.get(food_description_id='01001', sequence=3).pk, untouched_pk)
+        self.assertEqual(models.Weight.objects.get(food_description_id='01001', sequence=1).pk, weight.pk)
+
+    def test_duplicate_keys(self):
+        call_command('import_usda')
+        footnote = models.Footnote.objects.order_by('pk').first()
+        footnote.pk = None
+        footnote.save()
+        with self.assertRaisesMessage(CommandError, 'usda_nutrition_footnote has more than one row'):
+            call_command('import_usda', mode='sync')
+        footnote.delete()
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        for filename in os.listdir(package_data_dir()):
+            if filename.endswith('.txt.gz'):
+                shutil.copy(os.path.join(package_data_dir(), filename), directory)
+        with gzip.open(os.path.join(directory, 'FOOTNOTE.txt.gz'), 'rb') as f:
+            first_line = f.readline()
+        with gzip.open(os.path.join(directory, 'FOOTNOTE.txt.gz'), 'ab') as f:
+            f.write(first_line)
+        with self.assertRaisesMessage(CommandError, 'FOOTNOTE.txt has more than one row'):
+            call_command('import_usda', mode='sync', data_dir=directory)
+
+    def test_requires_sqlite_upsert(self):
+        with mock.patch.object(connection.Database, 'sqlite_version_info', (3, 22, 0)):
+            with self.assertRaisesMessage(CommandError, 'needs SQLite 3.24.0 or later'):
+                call_command('import_usda', mode='sync')
+
+
+class TestProfile(TestCase):
+    def test_stage_timings(self):
+        fd, path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        reset_queries()
+        call_command('import_usda', engine='copy', profile='stages', profile_output=path)
+        with open(path) as f:
+            profile = json.load(f)
+        # Queries are counted without turning on the query log.
+        self.assertEqual(len(connection.queries_log), 0)
+
+        self.assertEqual(profile['engine'], 'copy')
+        files = {info['filename']: info for info in profile['files']}
+        self.assertEqual(files['WEIGHT.txt']['rows'], 15438)
+        # One executemany() per batch of 2000 rows.
+        self.assertEqual(files['WEIGHT.txt']['queries'], 8)
+        for info in files.values():
+            self.assertGreater(info['queries'], 0)
+            self.assertAlmostEqual(info['parse'] + info['convert'] + info['write'], info['seconds'], places=6)
+        self.assertEqual(
+            [stage['stage'] for stage in profile['post_import']],
+            [description for description, _ in import_usda.POST_IMPORT_STAGES + import_usda.POST_COMMIT_STAGES])
+
+    def test_query_counter(self):
+        def query():
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+
+        with import_usda.QueryCounter(connection) as outer:
+            query()
+            with import_usda.QueryCounter(connection) as inner:
+                query()
+            query()
+        self.assertEqual((outer.count, inner.count), (3, 1))
+        self.assertNotIn('_prepare_cursor', vars(connections[connection.alias]))
+
+        # Without cursor wrapping (Django before 1.11), the query log is
+        # counted.
+        counter = import_usda.QueryCounter(connection)
+        counter.wrap_cursors = False
+        with counter:
+            query()
+        self.assertEqual(counter.count, 1)
+        self.assertFalse(connection.force_debug_cursor)
+
+    def test_cprofile(self):
+        stdout = io.StringIO()
+        call_command('import_usda', engine='copy', profile='cprofile', stdout=stdout)
+        self.assertIn('cumulative', stdout.getvalue())
+
+    def test_requires_serial_full_import(self):
+        with self.assertRaises(CommandError):
+            call_command('import_usda', mode='sync', profile='stages')
+
+
+class TestDataSources(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.data_files = [
+            filename[:-len('.gz')] for filename in os.listdir(package_data_dir())
+            if filename.endswith('.txt.gz')]
+
+    def read_data_file(self, filename):
+        """
+        Return the uncompressed contents of a shipped data file, with one food
+        group renamed so that imports from the copies can be told apart.
+        """
+        with gzip.open(os.path.join(package_data_dir(), filename + '.gz'), 'rb') as f:
+            data = f.read()
+        if filename == 'FD_GROUP.txt':
+            data = data.replace(b'~Dairy and Egg Products~', b'~Dairy and Egg Products (copy)~')
+        return data
+
+    def test_zip_archive(self):
+        path = os.path.join(self.directory, 'sr28asc.zip')
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for filename in self.data_files:
+                archive.writestr('sr28asc/%s' % filename.lower(), self.read_data_file(filename))
+
+        call_command('import_usda', engine='copy')
+        expected = dump_tables()
+        for info in reversed(import_usda.input_files()):
+            info['model'].objects.all().delete()
+
+        call_command('import_usda', engine='copy', data_dir=path)
+        self.assertEqual(models.FoodGroup.objects.get(pk='0100').description, 'Dairy and Egg Products (copy)')
+        expected['FD_GROUP.txt'][0] = ('0100', 'Dairy and Egg Products (copy)')
+        self.assertEqual(dump_tables(), expected)
+
+    def test_package_data_is_compressed(self):
+        source = get_source()
+        self.assertIn('FOOD_DES.txt', self.data_files)
+        for filename in self.data_files:
+            self.assertEqual(source.find(filename), os.path.join(package_data_dir(), filename + '.gz'))
+
+    def test_uncompressed_files(self):
+        for filename in self.data_files:
+            with open(os.path.join(self.directory, filename), 'wb') as f:
+                f.write(self.read_data_file(filename))
+
+        call_command('import_usda', mode='sync')
+        with self.settings(USDA_NUTRITION_DATA_DIR=self.directory):
+            stdout = io.StringIO()
+            with mock.patch('sys.stdout', stdout):
+                call_command('import_usda', mode='sync')
+        # Only the renamed food group differs in the uncompressed copies.
+        self.assertIn('Synced FD_GROUP.txt: 0 inserted, 1 updated, 0 deleted, 24 unchanged', stdout.getvalue())
+        self.assertIn('Synced WEIGHT.txt: 0 inserted, 0 updated, 0 deleted, 15438 unchanged', stdout.getvalue())
+        self.assertEqual(models.FoodGroup.objects.get(pk='0100').description, 'Dairy and Egg Products (copy)')
+
+    def test_decodes_cp1252(self):
+        with open(os.path.join(self.directory, 'FD_GROUP.txt'), 'wb') as f:
+            f.write('~0100~^~Caf\xe9 Products~\r\n'.encode('cp1252'))
+        rows = list(import_usda.read_rows('FD_GROUP.txt', get_source(self.directory)))
+        self.assertEqual(rows, [['0100', 'Caf\xe9 Products']])
+
+    def test_invalid_location(self):
+        with self.assertRaises(CommandError):
+            call_command('import_usda', data_dir=os.path.join(self.directory, 'missing'))
@@ -0,0 +1,121 @@
+import os
+import tempfile
+from unittest import mock
+
+import numpy as np
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from usda_nutrition import models
+from usda_nutrition.management.commands import import_usda
+from usda_nutrition.matrix import NutrientMatrix, find_foods, get_matrix
+
+from .factories import NutrientDataMixin, create_nutrient_data
+
+
+class TestNutrientMatrix(TestCase):
+    def setUp(self):
+        create_nutrient_data()
+        self.matrix = NutrientMatrix.from_database()
+
+    def test_index_maps(self):
+        self.assertEqual(self.matrix.ndb_nos, ['01001', '01009', '09003', '11090'])
+        # Nutrients follow SR's sort order.
+        self.assertEqual(self.matrix.nutrient_numbers, ['208', '203', '204', '291'])
+        self.assertEqual(self.matrix.value('01009', '203'), 22.87)
+
+    def test_missing_values(self):
+        self.assertIsNone(self.matrix.value('01009', '291'))
+        self.assertEqual(self.matrix.profile('01009'), {'208': 404, '203': 22.87, '204': 33.31})
+        self.assertEqual(self.matrix.totals([('01009', 100)])[self.matrix.nutrient_index['291']], 0)
+
+    def test_totals(self):
+        totals = self.matrix.totals([('01001', 14), ('09003', 200)])
+        self.assertAlmostEqual(totals[self.matrix.nutrient_index['208']], 717 * 0.14 + 52 * 2)
+        self.assertAlmostEqual(totals[self.matrix.nutrient_index['291']], 4.8)
+
+    def test_totals_many(self):
+        recipes = [[('01001', 14), ('09003', 200)], [('11090', 100)], []]
+        totals = self.matrix.totals_many(recipes)
+        self.assertEqual(totals.shape, (3, 4))
+        np.testing.assert_allclose(totals[0], self.matrix.totals(recipes[0]))
+        np.testing.assert_allclose(totals[1], self.matrix.values[self.matrix.food_index['11090']])
+        np.testing.assert_allclose(totals[2], 0)
+
+    def test_save_and_memory_map(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+
+        self.matrix.save(path)
+        loaded = NutrientMatrix.load(path)
+        self.assertIsInstance(loaded.values, np.memmap)
+        self.assertEqual(loaded.ndb_nos, self.matrix.ndb_nos)
+        self.assertEqual(loaded.nutrient_numbers, self.matrix.nutrient_numbers)
+        np.testing.assert_array_equal(loaded.values, self.matrix.values)
+
+
+class TestFindFoods(NutrientDataMixin, TestCase):
+    def setUp(self):
+        super(TestFindFoods, self).setUp()
+        self.matrix = NutrientMatrix.from_database()
+
+    def test_find(self):
+        self.assertEqual(self.matrix.find({'203__gt': 1}), ['01009', '11090'])
+        self.assertEqual(self.matrix.find({'203__lt': 1, '204__lte': 0.17}), ['09003'])
+        self.assertEqual(self.matrix.find({'208__range': (52, 404)}), ['01009', '09003'])
+        self.assertEqual(self.matrix.find({'291': 0}), ['01001'])
+        # Cheddar has no fibre value, so it matches no fibre constraint.
+        self.assertEqual(self.matrix.find({'291__lt': 5}), ['01001', '09003', '11090'])
+        self.assertEqual(self.matrix.find({'291__range': (0, 5)}), ['01001', '09003', '11090'])
+
+    def test_order_by(self):
+        self.assertEqual(self.matrix.find({}, order_by='-208', limit=2), ['01001', '01009'])
+        self.assertEqual(self.matrix.find({'204__gt': 30}, order_by=['-203']), ['01009', '01001'])
+        # Foods without a value sort last either way.
+        self.assertEqual(self.matrix.find({}, order_by='291'), ['01001', '09003', '11090', '01009'])
+        self.assertEqual(self.matrix.find({}, order_by='-291'), ['11090', '09003', '01001', '01009'])
+
+    def test_batched_lookups(self):
+        # As on SQLite before 3.32, which allows 999 parameters per query.
+        with mock.patch.object(connection.ops, 'bulk_batch_size', return_value=3):
+            with self.assertNumQueries(2):
+                foods = models.FoodDescription.objects.in_bulk(self.matrix.ndb_nos)
+        self.assertEqual(sorted(foods), self.matrix.ndb_nos)
+
+    def test_find_foods(self):
+        # The data version, matrix and nutrient definitions are loaded on
+        # first use.
+        with self.assertNumQueries(6):
+            foods = find_foods({'PROCNT__gt': 0.5, 'fat__lt': 40}, order_by='-FIBTG')
+        self.assertEqual([food.pk for food in foods], ['11090', '01009'])
+        self.assertEqual(foods[0].nutrient_values, {'PROCNT': 2.82, 'fat': 0.37, 'FIBTG': 2.6})
+        with self.assertNumQueries(1):
+            foods = find_foods({'203__gte': 22.87, '208': 404})
+        self.assertEqual([food.pk for food in foods], ['01009'])
+        foods = find_foods({'FAT__gt': 30}, order_by='FIBTG')
+        self.assertEqual([food.nutrient_values['FIBTG'] for food in foods], [0, None])
+        with self.assertRaises(KeyError):
+            find_foods({'VITX__gt': 0})
+
+    @override_settings(USDA_NUTRITION_CACHE_TIMEOUT=0)
+    def test_reloaded_for_new_data_version(self):
+        self.assertEqual(get_matrix().value('01009', '203'), 22.87)
+        models.NutrientData.objects.filter(food_description='01009', nutrient_definition='203').update(nutrient_value=25)
+        self.assertEqual(get_matrix().value('01009', '203'), 22.87)
+        models.DataVersion.objects.create(pk=1, version=1)
+        self.assertEqual(get_matrix().value('01009', '203'), 25)
+
+    @override_settings(USDA_NUTRITION_CACHE_TIMEOUT=0)
+    def test_import_rewrites_matrix_file(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        with override_settings(USDA_NUTRITION_MATRIX_PATH=path):
+            import_usda.save_nutrient_matrix()
+            self.assertEqual(get_matrix().value('01009', '203'), 22.87)
+
+            models.NutrientData.objects.filter(food_description='01009', nutrient_definition='203').update(nutrient_value=25)
+            import_usda.save_nutrient_matrix()
+            models.DataVersion.objects.create(pk=1, version=1)
+            self.assertEqual(get_matrix().value('01009', '203'), 25)
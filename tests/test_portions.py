@@ -0,0 +1,89 @@
+from decimal import Decimal
+
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from usda_nutrition import models, portions
+from usda_nutrition.portions import PortionIndex, normalize
+from usda_nutrition.signals import data_imported
+
+from .factories import NutrientDataMixin
+
+
+WEIGHTS = [
+    ('01001', 1, 'pat (1" sq, 1/3" high)', 5.0),
+    ('01001', 1, 'tbsp', 14.2),
+    ('01001', 1, 'cup', 227),
+    ('09003', 1, 'cup, quartered or chopped', 125),
+    ('09003', 1, 'cup slices', 109),
+    ('09003', 1, 'medium (3" dia)', 182),
+    ('11090', 0.5, 'cup chopped', 44),
+]
+
+
+class TestNormalize(SimpleTestCase):
+    def test_normalize(self):
+        self.assertEqual(normalize('Pat (1" sq, 1/3" high)'), ('pat', 'pat'))
+        self.assertEqual(normalize('Tablespoons'), ('tbsp', 'tbsp'))
+        self.assertEqual(normalize('Tbsp.'), ('tbsp', 'tbsp'))
+        self.assertEqual(normalize('fluid ounces'), ('fl oz', 'fl oz'))
+        self.assertEqual(normalize('Cups, chopped'), ('cup chopped', 'cup'))
+
+
+class TestPortionIndex(SimpleTestCase):
+    def setUp(self):
+        self.index = PortionIndex(WEIGHTS)
+
+    def test_measures(self):
+        self.assertEqual(self.index.to_grams([
+            ('01001', 2, 'tbsp'),
+            ('01001', 1, 'pats'),
+            ('09003', 1, 'cup slices'),
+            ('09003', 2, 'Medium'),
+            ('11090', 1, 'cups, chopped'),
+        ]), [28.4, 5.0, 109.0, 364.0, 88.0])
+
+    def test_falls_back_to_unit(self):
+        # No "cup, diced" measure, so the first cup measure is used.
+        self.assertEqual(self.index.grams('09003', 1, 'cup, diced'), 125.0)
+
+    def test_mass_and_volume_units(self):
+        self.assertEqual(self.index.grams('99999', 2, 'oz'), 2 * 28.349523125)
+        self.assertEqual(self.index.grams('01001', 100, 'grams'), 100.0)
+        # Through the density of the first volume measure.
+        self.assertAlmostEqual(self.index.grams('01001', 3, 'tsp'), 14.2)
+        self.assertAlmostEqual(self.index.grams('09003', 1, 'fl oz'), 125 / 8.0)
+
+    def test_decimal_quantity(self):
+        self.assertEqual(self.index.grams('01001', Decimal('2'), 'tbsp'), 28.4)
+        self.assertEqual(self.index.grams('01001', Decimal('1.5'), 'oz'), 1.5 * 28.349523125)
+        self.assertAlmostEqual(self.index.grams('01001', Decimal('3'), 'tsp'), 14.2)
+
+    def test_unconvertible(self):
+        self.assertEqual(self.index.to_grams([('01001', 1, 'slice'), ('99999', 1, 'cup')]), [None, None])
+
+
+class TestProcessIndex(NutrientDataMixin, TestCase):
+    def test_to_grams(self):
+        models.Weight.objects.create(
+            food_description_id='01001', sequence=1, amount=1, measure_description='tbsp', gram_weight=14.2)
+        # The data version, then the weights.
+        with self.assertNumQueries(2):
+            self.assertEqual(portions.to_grams([('01001', 2, 'Tablespoons')]), [28.4])
+            self.assertEqual(portions.to_grams([('01001', 1, 'tbsp')] * 100), [14.2] * 100)
+
+        models.Weight.objects.filter(food_description_id='01001').update(gram_weight=15)
+        data_imported.send(sender=models.DataVersion, version=1)
+        self.assertEqual(portions.to_grams([('01001', 1, 'tbsp')]), [15.0])
+
+    @override_settings(USDA_NUTRITION_CACHE_TIMEOUT=0)
+    def test_rebuilt_for_new_data_version(self):
+        # As in a process other than the one that ran import_usda, which
+        # doesn't receive data_imported.
+        models.Weight.objects.create(
+            food_description_id='01001', sequence=1, amount=1, measure_description='tbsp', gram_weight=14.2)
+        self.assertEqual(portions.to_grams([('01001', 1, 'tbsp')]), [14.2])
+        models.Weight.objects.filter(food_description_id='01001').update(gram_weight=15)
+        self.assertEqual(portions.to_grams([('01001', 1, 'tbsp')]), [14.2])
+
+        models.DataVersion.objects.create(pk=1, version=1)
+        self.assertEqual(portions.to_grams([('01001', 1, 'tbsp')]), [15.0])
@@ -0,0 +1,65 @@
+import json
+
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+
+from usda_nutrition import models, profiles
+
+from .factories import NutrientDataMixin
+
+
+class TestProfiles(NutrientDataMixin, TestCase):
+    def setUp(self):
+        super(TestProfiles, self).setUp()
+        models.Weight.objects.create(
+            food_description_id='01001', sequence=1, amount=1, measure_description='pat (1" sq, 1/3" high)',
+            gram_weight='5.0')
+        models.Footnote.objects.create(
+            food_description_id='01001', footnote_no='01', footnote_type='N', nutrient_definition_id='204',
+            footnote_text='Café sample')
+        models.DataVersion.objects.create(pk=1, version=1)
+        profiles.build_profiles()
+        caches['default'].clear()
+
+    def test_build_profiles(self):
+        self.assertEqual(models.FoodProfile.objects.count(), 4)
+        profile = json.loads(profiles.get_profile('01001').decode('utf-8'))
+        self.assertEqual(profile['ndb_no'], '01001')
+        self.assertEqual(profile['food_group'], {'code': '0100', 'description': 'Dairy and Egg Products'})
+        self.assertEqual(profile['weights'], [
+            {'sequence': 1, 'amount': 1.0, 'measure_description': 'pat (1" sq, 1/3" high)', 'gram_weight': 5.0}])
+        self.assertEqual(profile['footnotes'], [
+            {'footnote_no': '01', 'footnote_type': 'N', 'nutrient_number': '204', 'footnote_text': 'Café sample'}])
+        self.assertEqual(
+            [(nutrient['tagname'], nutrient['value']) for nutrient in profile['nutrients']],
+            [('ENERC_KCAL', 717.0), ('PROCNT', 0.85), ('FAT', 81.11), ('FIBTG', 0.0)])
+
+        apples = json.loads(profiles.get_profile('09003').decode('utf-8'))
+        self.assertEqual((apples['weights'], apples['footnotes']), ([], []))
+
+    def test_reads_through_cache(self):
+        # The data version, then the profile.
+        with self.assertNumQueries(2):
+            data = profiles.get_profile('01001')
+        with self.assertNumQueries(0):
+            self.assertEqual(profiles.get_profile('01001'), data)
+            self.assertEqual(profiles.get_profiles(['01001']), {'01001': data})
+        with self.assertNumQueries(1):
+            self.assertEqual(sorted(profiles.get_profiles(['01001', '09003', '99999'])), ['01001', '09003'])
+        self.assertIsNone(profiles.get_profile('99999'))
+
+    @override_settings(USDA_NUTRITION_CACHE_TIMEOUT=0)
+    def test_keys_follow_data_version(self):
+        profiles.get_profile('01001')
+        models.FoodDescription.objects.filter(pk='01001').update(long_desc='Butter, unsalted')
+        profiles.build_profiles()
+        self.assertIn(b'Butter, salted', profiles.get_profile('01001'))
+
+        models.DataVersion.objects.filter(pk=1).update(version=2)
+        self.assertIn(b'Butter, unsalted', profiles.get_profile('01001'))
+
+    def test_only_changed_profiles_written(self):
+        self.assertEqual(profiles.build_profiles(), 0)
+        models.FoodDescription.objects.filter(pk='01001').update(long_desc='Butter, unsalted')
+        self.assertEqual(profiles.build_profiles(), 1)
+        self.assertIn(b'Butter, unsalted', bytes(models.FoodProfile.objects.get(pk='01001').data))
@@ -0,0 +1,69 @@
+from django.core.management import call_command
+from django.db.models import F
+from django.test import TestCase, override_settings
+
+from usda_nutrition import cache, models, search
+from usda_nutrition.search import search_foods, tokenize
+
+
+class TestTokenize(TestCase):
+    def test_expands_abbreviations(self):
+        self.assertEqual(tokenize('BUTTER,WHIPPED,W/ SALT'), ['butter', 'whipped', 'with', 'salt'])
+        self.assertEqual(tokenize('BEEF,RND,LN&FAT,CKD'), ['beef', 'round', 'lean', 'fat', 'cooked'])
+        self.assertEqual(tokenize('CEREALS RTE'), ['cereal', 'ready', 'to', 'eat'])
+
+    def test_normalizes_plurals(self):
+        self.assertEqual(tokenize('Apples, Cherries, Potatoes, Grass, Asparagus'), ['apple', 'cherry', 'potato', 'grass', 'asparagus'])
+
+
+class SearchTests(object):
+    @classmethod
+    def setUpTestData(cls):
+        call_command('import_usda')
+
+    def search(self, query, **kwargs):
+        return [food.ndb_no for food in search_foods(query, **kwargs)]
+
+    def test_ranking(self):
+        results = search_foods('butter salted', limit=5)
+        self.assertEqual(results[0].long_desc, 'Butter, salted')
+        self.assertTrue(all(a.search_rank >= b.search_rank for a, b in zip(results, results[1:])))
+
+    def test_all_terms_must_match(self):
+        for food in search_foods('cheddar cheese', limit=50):
+            self.assertIn('cheddar', food.long_desc.lower())
+
+    def test_abbreviations_and_prefixes(self):
+        self.assertIn('01001', self.search('butter w/ salt'))
+        self.assertIn('01001', self.search('salted butt'))
+
+    def test_food_group(self):
+        results = search_foods('raw', limit=20, food_group='0900')
+        self.assertEqual(len(results), 20)
+        self.assertTrue(all(food.food_group_id == '0900' for food in results))
+
+    def test_no_results(self):
+        self.assertEqual(self.search('xyzzy'), [])
+        self.assertEqual(self.search(''), [])
+
+
+@override_settings(USDA_NUTRITION_SEARCH_BACKEND='sqlite')
+class TestSQLiteSearch(SearchTests, TestCase):
+    def test_backend(self):
+        self.assertIsInstance(search.get_backend(), search.SQLiteBackend)
+
+
+class TestPythonSearch(SearchTests, TestCase):
+    def test_backend(self):
+        # The default on databases other than PostgreSQL.
+        self.assertIsInstance(search.get_backend(), search.PythonBackend)
+
+    @override_settings(USDA_NUTRITION_CACHE_TIMEOUT=0)
+    def test_rebuilt_for_new_data_version(self):
+        cache.invalidate_all()
+        self.addCleanup(cache.invalidate_all)
+        self.assertEqual(self.search('xyzzy'), [])
+        models.FoodDescription.objects.filter(pk='01001').update(long_desc='Butter, xyzzy')
+        self.assertEqual(self.search('xyzzy'), [])
+        models.DataVersion.objects.update(version=F('version') + 1)
+        self.assertEqual(self.search('xyzzy'), ['01001'])
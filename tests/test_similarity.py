@@ -0,0 +1,77 @@
+import os
+import tempfile
+
+from django.test import TestCase, override_settings
+
+from usda_nutrition import models
+from usda_nutrition.management.commands import import_usda
+from usda_nutrition.matrix import NutrientMatrix
+from usda_nutrition.similarity import SimilarityIndex, similar_foods
+
+from .factories import NutrientDataMixin
+
+
+class TestSimilarFoods(NutrientDataMixin, TestCase):
+    def setUp(self):
+        super(TestSimilarFoods, self).setUp()
+        self.index = SimilarityIndex.from_matrix(NutrientMatrix.from_database())
+
+    def test_similar(self):
+        nearest = self.index.similar('09003', k=2)
+        self.assertEqual([ndb_no for ndb_no, distance in nearest], ['11090', '01009'])
+        self.assertLess(nearest[0][1], nearest[1][1])
+
+    def test_food_group(self):
+        self.assertEqual(self.index.similar('01001', food_group='0100'), [('01009', self.index.similar('01001', k=1)[0][1])])
+        self.assertEqual(self.index.similar('01001', food_group='0900', k=5)[0][0], '09003')
+        self.assertEqual(self.index.similar('01001', food_group='2000'), [])
+
+    def test_nutrients(self):
+        # By fibre alone, broccoli is closest to apples.
+        self.assertEqual(self.index.similar('09003', k=1, nutrients=['291'])[0][0], '11090')
+        # By protein alone, butter is.
+        self.assertEqual(self.index.similar('09003', k=1, nutrients=['203'])[0][0], '01001')
+
+    def test_per_kcal(self):
+        self.assertEqual(len(self.index.similar('01001', k=10, basis='kcal')), 3)
+        with self.assertRaises(ValueError):
+            self.index.similar('01001', basis='serving')
+
+    def test_similar_foods(self):
+        # The data version and four to build the index on first use, then one
+        # for the foods.
+        with self.assertNumQueries(6):
+            foods = similar_foods('09003', k=3)
+        self.assertEqual([food.pk for food in foods], ['11090', '01009', '01001'])
+        self.assertGreater(foods[0].distance, 0)
+        with self.assertNumQueries(1):
+            similar_foods('01001', k=3)
+
+    def test_saved_index(self):
+        fd, path = tempfile.mkstemp(suffix='.npz')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        with override_settings(USDA_NUTRITION_SIMILARITY_PATH=path):
+            import_usda.save_similarity_index()
+            loaded = SimilarityIndex.load(path)
+            self.assertEqual(loaded.ndb_nos, self.index.ndb_nos)
+            self.assertEqual(loaded.similar('09003', k=3), self.index.similar('09003', k=3))
+            # The data version and the foods.
+            with self.assertNumQueries(2):
+                similar_foods('09003', k=3)
+
+    @override_settings(USDA_NUTRITION_CACHE_TIMEOUT=0)
+    def test_reloaded_for_new_data_version(self):
+        fd, path = tempfile.mkstemp(suffix='.npz')
+        os.close(fd)
+        self.addCleanup(os.remove, path)
+        with override_settings(USDA_NUTRITION_SIMILARITY_PATH=path):
+            import_usda.save_similarity_index()
+            self.assertEqual(similar_foods('09003', k=1)[0].pk, '11090')
+
+            # Another process re-imports with broccoli moved to the fruits.
+            models.FoodDescription.objects.filter(pk='11090').update(food_group_id='0900')
+            import_usda.save_similarity_index()
+            self.assertEqual(similar_foods('09003', k=1, food_group='0900'), [])
+            models.DataVersion.objects.create(pk=1, version=1)
+            self.assertEqual([food.pk for food in similar_foods('09003', k=1, food_group='0900')], ['11090'])
@@ -0,0 +1,83 @@
+import os
+import subprocess
+import sys
+import tempfile
+from decimal import Decimal
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from usda_nutrition import models
+from usda_nutrition.snapshot import Snapshot
+
+from .factories import NUTRIENT_VALUES, create_nutrient_data
+
+
+class TestSnapshot(TestCase):
+    def setUp(self):
+        create_nutrient_data()
+        models.FoodDescription.objects.filter(ndb_no='09003').update(
+            refuse=10, refuse_description='Core and stem', protein_factor=Decimal('3.36'), survey=True)
+        models.Weight.objects.create(
+            food_description_id='09003', sequence=2, amount=1, measure_description='medium (3" dia)', gram_weight=182)
+        models.Weight.objects.create(
+            food_description_id='09003', sequence=1, amount=1, measure_description='cup, quartered or chopped', gram_weight=125)
+        models.Footnote.objects.create(
+            food_description_id='01009', footnote_no='01', footnote_type='N', nutrient_definition_id='203',
+            footnote_text='Værdi')
+
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+        self.addCleanup(os.remove, self.path)
+        call_command('export_snapshot', self.path, stdout=open(os.devnull, 'w'))
+        self.snapshot = Snapshot(self.path)
+        self.addCleanup(self.snapshot.close)
+
+    def test_foods(self):
+        self.assertEqual(len(self.snapshot), 4)
+        self.assertEqual(self.snapshot.ndb_nos(), ['01001', '01009', '09003', '11090'])
+        self.assertIn('09003', self.snapshot)
+        self.assertNotIn('99999', self.snapshot)
+        self.assertEqual(self.snapshot.meta, {'release': 'SR28'})
+
+        food = self.snapshot.food('09003')
+        self.assertEqual(food.long_desc, 'Apples, raw, with skin')
+        self.assertEqual(food.food_group_id, '0900')
+        self.assertEqual(food.refuse, 10)
+        self.assertEqual(food.protein_factor, 3.36)
+        self.assertIs(food.survey, True)
+        self.assertIsNone(food.com_name)
+        self.assertIsNone(food.fat_factor)
+        self.assertIsNone(self.snapshot.food('01001').survey)
+
+        with self.assertRaises(KeyError):
+            self.snapshot.food('99999')
+
+    def test_related_rows(self):
+        self.assertEqual(
+            [(weight.sequence, weight.measure_description, weight.gram_weight)
+             for weight in self.snapshot.weights('09003')],
+            [(1, 'cup, quartered or chopped', 125.0), (2, 'medium (3" dia)', 182.0)])
+        self.assertEqual(self.snapshot.weights('01001'), [])
+        self.assertEqual(
+            [(footnote.nutrient_definition_id, footnote.footnote_text) for footnote in self.snapshot.footnotes('01009')],
+            [('203', 'Værdi')])
+        for ndb_no, values in NUTRIENT_VALUES.items():
+            self.assertEqual(self.snapshot.nutrients(ndb_no), {number: float(value) for number, value in values.items()})
+
+    def test_reference_tables(self):
+        self.assertEqual([group.code for group in self.snapshot.food_groups()], ['0100', '0900', '1100'])
+        self.assertEqual(
+            [nutrient.tagname for nutrient in self.snapshot.nutrient_definitions()],
+            ['ENERC_KCAL', 'PROCNT', 'FAT', 'FIBTG'])
+
+    def test_read_without_settings(self):
+        env = dict(os.environ)
+        env.pop('DJANGO_SETTINGS_MODULE', None)
+        env['PYTHONPATH'] = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        output = subprocess.check_output([
+            sys.executable, '-c',
+            'import sys; from usda_nutrition.snapshot import Snapshot; '
+            'print(Snapshot(sys.argv[1]).food("09003").long_desc)', self.path,
+        ], env=env, universal_newlines=True)
+        self.assertEqual(output, 'Apples, raw, with skin\n')
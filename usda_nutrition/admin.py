@@ -1,8 +1,72 @@
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 
 from . import models
 
 
+# Below this many rows, an exact COUNT(*) is cheap enough.
+ESTIMATE_THRESHOLD = 10000
+
+# Maximum number of foods a full-text search in the admin matches.
+SEARCH_LIMIT = 500
+
+
+def estimated_count(queryset):
+    """
+    Count the rows of `queryset`, using the planner's estimate for unfiltered
+    querysets of large tables on PostgreSQL instead of a full scan.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql' and not queryset.query.where:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                [queryset.model._meta.db_table])
+            row = cursor.fetchone()
+        if row and row[0] >= ESTIMATE_THRESHOLD:
+            return row[0]
+    return queryset.count()
+
+
+class EstimatedCountPaginator(Paginator):
+    @cached_property
+    def count(self):
+        return estimated_count(self.object_list)
+
+
+class OnlyChangeList(ChangeList):
+    def get_queryset(self, request):
+        queryset = super(OnlyChangeList, self).get_queryset(request)
+        if self.model_admin.list_only:
+            queryset = queryset.only(*self.model_admin.list_only)
+        return queryset
+
+
+def food_group_filter(lookup):
+    """
+    Return a list filter on the food group found through `lookup`, with its
+    choices read from the reference data cache.
+    """
+    class FoodGroupFilter(admin.SimpleListFilter):
+        title = 'food group'
+        parameter_name = 'food_group'
+
+        def lookups(self, request, model_admin):
+            groups = models.FoodGroup.cached.as_dict().values()
+            return [(group.code, group.description) for group in sorted(groups, key=lambda group: group.code)]
+
+        def queryset(self, request, queryset):
+            if self.value():
+                return queryset.filter(**{lookup: self.value()})
+            return queryset
+
+    return FoodGroupFilter
+
+
 class ReadOnlyAdminMixin():
     def get_readonly_fields(self, request, obj=None):
         return list(set(
@@ -12,41 +76,111 @@ class ReadOnlyAdminMixin():
 
 
 class ReadOnlyAdmin(ReadOnlyAdminMixin, admin.ModelAdmin):
-    pass
+    # Fields to load for the changelist; the change form loads every field.
+    list_only = None
+
+    def get_changelist(self, request, **kwargs):
+        return OnlyChangeList
+
+
+class LargeTableAdmin(ReadOnlyAdmin):
+    """
+    Avoids counting the whole table on every changelist page.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class FoodSearchAdminMixin():
+    """
+    Searches by NDB number, or through the full-text food index, for models
+    related to foods through `food_lookup`.
+    """
+    food_lookup = 'food_description'
+    # Only turns on the search box: get_search_results() doesn't use it.
+    search_fields = ('=food_description__ndb_no',)
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        if search_term.isdigit():
+            ndb_nos = [search_term.zfill(5)]
+        else:
+            from . import search
+
+            ndb_nos = [ndb_no for ndb_no, rank in search.rank_foods(search_term, limit=SEARCH_LIMIT)]
+        return queryset.filter(**{'%s__in' % self.food_lookup: ndb_nos}), False
 
 
 class DerivationCodeAdmin(ReadOnlyAdmin):
     list_display = ('code', 'description')
 
 
-class FoodDescriptionAdmin(ReadOnlyAdmin):
+class FoodDescriptionAdmin(FoodSearchAdminMixin, LargeTableAdmin):
     list_display = ('ndb_no', 'food_group', 'short_desc')
+    list_select_related = ('food_group',)
+    list_only = ('ndb_no', 'short_desc', 'food_group__code', 'food_group__description')
+    list_filter = (food_group_filter('food_group'),)
+    food_lookup = 'pk'
+    # As above, descriptions are searched through the full-text index.
+    search_fields = ('=ndb_no',)
 
 
 class FoodGroupAdmin(ReadOnlyAdmin):
     list_display = ('code', 'description')
 
 
-class FootnoteAdmin(ReadOnlyAdmin):
+class FootnoteAdmin(FoodSearchAdminMixin, ReadOnlyAdmin):
     list_display = ('pk', 'footnote_no', 'food_description', 'footnote_type')
+    list_select_related = ('food_description',)
+    list_only = ('footnote_no', 'footnote_type', 'food_description__ndb_no', 'food_description__short_desc')
+    list_filter = (food_group_filter('food_description__food_group'), 'footnote_type')
 
 
 class NutrientDefinitionAdmin(ReadOnlyAdmin):
     list_display = ('nutrient_number', 'tagname', 'nutrient_description')
 
 
+class NutrientDataAdmin(FoodSearchAdminMixin, LargeTableAdmin):
+    list_display = ('food_description_id', 'nutrient_definition_id', 'nutrient_value')
+    list_select_related = False
+    list_only = ('food_description', 'nutrient_definition', 'nutrient_value')
+    list_filter = (food_group_filter('food_description__food_group'),)
+
+
 class SourceCodeAdmin(ReadOnlyAdmin):
     list_display = ('source_code', 'description')
 
 
-class WeightAdmin(ReadOnlyAdmin):
+class WeightAdmin(FoodSearchAdminMixin, LargeTableAdmin):
     list_display = ('food_description', 'amount', 'measure_description')
-
-
-admin.site.register(models.DerivationCode, DerivationCodeAdmin)
-admin.site.register(models.FoodDescription, FoodDescriptionAdmin)
-admin.site.register(models.FoodGroup, FoodGroupAdmin)
-admin.site.register(models.Footnote, FootnoteAdmin)
-admin.site.register(models.NutrientDefinition, NutrientDefinitionAdmin)
-admin.site.register(models.SourceCode, SourceCodeAdmin)
-admin.site.register(models.Weight, WeightAdmin)
+    list_select_related = ('food_description',)
+    list_only = ('amount', 'measure_description', 'food_description__ndb_no', 'food_description__short_desc')
+    list_filter = (food_group_filter('food_description__food_group'),)
+
+
+MODEL_ADMINS = (
+    (models.DerivationCode, DerivationCodeAdmin),
+    (models.FoodDescription, FoodDescriptionAdmin),
+    (models.FoodGroup, FoodGroupAdmin),
+    (models.Footnote, FootnoteAdmin),
+    (models.NutrientDefinition, NutrientDefinitionAdmin),
+    (models.NutrientData, NutrientDataAdmin),
+    (models.SourceCode, SourceCodeAdmin),
+    (models.Weight, WeightAdmin),
+)
+
+
+def register(site=admin.site):
+    """
+    Register the models on `site`. Called on import unless the
+    `USDA_NUTRITION_ADMIN` setting is False, for projects that register them
+    on their own site, or later.
+    """
+    for model, model_admin in MODEL_ADMINS:
+        site.register(model, model_admin)
+
+
+if getattr(settings, 'USDA_NUTRITION_ADMIN', True):
+    register()
@@ -0,0 +1,142 @@
+"""
+An asyncio interface to the food lookups, for ASGI and other async services:
+
+    from usda_nutrition import aio
+
+    food = await aio.get_food('01001')
+    foods = await aio.get_foods(['01001', '09003'])
+    results = await aio.search_foods('cheddar')
+
+Foods come with their weights, footnotes and nutrient data prefetched, and
+with their food group, nutrient definitions, source codes and derivation codes
+attached from the reference data cache.
+
+Lookups are coalesced: all the lookups started in the same tick of the event
+loop are made with one batch of queries, so a hundred concurrent `get_food()`
+calls cost as many queries as one `get_foods()` call. Identical concurrent
+searches are run once.
+
+Django's ORM is synchronous, so the batches run in a thread pool of
+`USDA_NUTRITION_ASYNC_WORKERS` threads (default: 4).
+"""
+import asyncio
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Prefetch
+
+from . import models, search
+from .cache import attach_references
+
+
+DEFAULT_WORKERS = 4
+
+executor = None
+_lock = threading.Lock()
+
+
+def get_executor():
+    global executor
+    if executor is None:
+        with _lock:
+            if executor is None:
+                executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'USDA_NUTRITION_ASYNC_WORKERS', DEFAULT_WORKERS),
+                    thread_name_prefix='usda_nutrition')
+    return executor
+
+
+def run_batch(batch_load, keys):
+    # Worker threads outlive requests, so expire their connections the way
+    # the request cycle would.
+    close_old_connections()
+    try:
+        return batch_load(keys)
+    finally:
+        close_old_connections()
+
+
+class Loader(object):
+    """
+    Coalesces the keys requested in one tick of an event loop into a single
+    call of `batch_load(keys)`, which returns a dict of the values found.
+    Keys without a value resolve to None.
+    """
+    def __init__(self, batch_load):
+        self.batch_load = batch_load
+        # Pending futures by key, per event loop.
+        self._pending = weakref.WeakKeyDictionary()
+
+    async def load(self, key):
+        loop = asyncio.get_event_loop()
+        pending = self._pending.get(loop)
+        if pending is None:
+            pending = self._pending[loop] = {}
+            loop.call_soon(self._dispatch, loop)
+        if key not in pending:
+            pending[key] = loop.create_future()
+        return await asyncio.shield(pending[key])
+
+    async def load_many(self, keys):
+        return await asyncio.gather(*[self.load(key) for key in keys])
+
+    def _dispatch(self, loop):
+        pending = self._pending.pop(loop)
+        batch = loop.run_in_executor(get_executor(), run_batch, self.batch_load, list(pending))
+
+        def resolve(batch):
+            for key, future in pending.items():
+                if future.cancelled():
+                    continue
+                if batch.exception() is not None:
+                    future.set_exception(batch.exception())
+                else:
+                    future.set_result(batch.result().get(key))
+
+        batch.add_done_callback(resolve)
+
+
+def load_foods(ndb_nos):
+    queryset = models.FoodDescription.objects.filter(pk__in=ndb_nos).prefetch_related(
+        Prefetch('weights', queryset=models.Weight.objects.order_by('sequence')),
+        Prefetch('footnotes', queryset=models.Footnote.objects.order_by('pk')),
+        Prefetch('nutrient_data', queryset=models.NutrientData.objects.order_by('nutrient_definition__sort_order')),
+    )
+    foods = attach_references(list(queryset))
+    for food in foods:
+        attach_references(food.footnotes.all())
+        attach_references(food.nutrient_data.all())
+    return {food.pk: food for food in foods}
+
+
+def load_searches(queries):
+    return {query: search.search_foods(*query) for query in queries}
+
+
+food_loader = Loader(load_foods)
+search_loader = Loader(load_searches)
+
+
+async def get_food(ndb_no):
+    food = await food_loader.load(ndb_no)
+    if food is None:
+        raise models.FoodDescription.DoesNotExist('FoodDescription matching query does not exist.')
+    return food
+
+
+async def get_foods(ndb_nos):
+    """
+    Return the foods for `ndb_nos`, in the same order, with None for those
+    that don't exist.
+    """
+    return await food_loader.load_many(ndb_nos)
+
+
+async def search_foods(query, limit=20, food_group=None):
+    """
+    The async version of `usda_nutrition.search.search_foods()`.
+    """
+    return await search_loader.load((query, limit, getattr(food_group, 'pk', food_group)))
@@ -0,0 +1,154 @@
+"""
+Process-wide, read-through caches of the small reference tables (food
+groups, nutrient definitions, source codes and derivation codes), which only
+change when `import_usda` runs.
+
+Each of those models has a `cached` attribute:
+
+    NutrientDefinition.cached.get('203')
+    FoodGroup.cached.as_dict()
+
+The first access loads the whole table into an immutable mapping; the rows in
+it are shared, so treat them as read-only. `import_usda` invalidates the
+caches of its own process through the `data_imported` signal. Other processes
+notice the new `DataVersion` stamp when they next check it, at most every
+`USDA_NUTRITION_CACHE_TIMEOUT` seconds (default: 60; `None` to never check).
+
+Other per-process data built from the tables is kept up to date the same way
+with `versioned()`.
+"""
+import functools
+import threading
+import time
+from types import MappingProxyType
+
+from django.apps import apps
+from django.conf import settings
+from django.dispatch import receiver
+
+from .signals import data_imported
+
+
+DEFAULT_TIMEOUT = 60
+
+VERSIONED = []
+
+
+def current_version():
+    DataVersion = apps.get_model('usda_nutrition', 'DataVersion')
+    return DataVersion.objects.values_list('version', flat=True).first() or 0
+
+
+_version = None
+_version_checked = 0
+
+
+def data_version():
+    """
+    Return the `DataVersion` stamp as last seen by this process, checking it
+    at most every `USDA_NUTRITION_CACHE_TIMEOUT` seconds.
+    """
+    global _version, _version_checked
+    timeout = getattr(settings, 'USDA_NUTRITION_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+    if _version is None or (timeout is not None and time.monotonic() - _version_checked >= timeout):
+        _version = current_version()
+        _version_checked = time.monotonic()
+    return _version
+
+
+class Versioned(object):
+    """
+    A process-wide value, built by calling `builder()` on first use and again
+    whenever `data_version()` changes. Call it to get the value.
+    """
+    def __init__(self, builder):
+        self.builder = builder
+        # (data version, value), replaced as a whole so that readers outside
+        # the lock never pair a value with the wrong version.
+        self._entry = None
+        self._lock = threading.Lock()
+        functools.update_wrapper(self, builder)
+        VERSIONED.append(self)
+
+    def __call__(self):
+        version = data_version()
+        entry = self._entry
+        if entry is None or entry[0] != version:
+            with self._lock:
+                entry = self._entry
+                if entry is None or entry[0] != version:
+                    entry = self._entry = (version, self.builder())
+        return entry[1]
+
+    def clear(self):
+        """
+        Drop the value, so that the next call builds it again.
+        """
+        self._entry = None
+
+
+def versioned(builder):
+    """
+    Decorate a function that builds some process-wide data from the tables,
+    so that it is called once and then again only after an import.
+    """
+    return Versioned(builder)
+
+
+class CachedLookup(object):
+    def __init__(self):
+        self.model = None
+        self._rows = Versioned(self._load)
+
+    def contribute_to_class(self, model, name):
+        self.model = model
+        setattr(model, name, self)
+
+    def _load(self):
+        return MappingProxyType({instance.pk: instance for instance in self.model._default_manager.all()})
+
+    def as_dict(self):
+        """
+        Return an immutable mapping of primary key to instance.
+        """
+        return self._rows()
+
+    def get(self, pk):
+        try:
+            return self.as_dict()[pk]
+        except KeyError:
+            raise self.model.DoesNotExist('%s matching primary key %r does not exist.' % (
+                self.model._meta.object_name, pk))
+
+    def invalidate(self):
+        self._rows.clear()
+
+
+@receiver(data_imported)
+def invalidate_all(**kwargs):
+    global _version
+    _version = None
+    for value in VERSIONED:
+        value.clear()
+
+
+def attach_references(instances):
+    """
+    Point the ForeignKeys of `instances` to cached models at the cached
+    rows, so that following them (`food.food_group`,
+    `footnote.nutrient_definition`, ...) doesn't query the database.
+    Returns `instances`.
+    """
+    fields_by_model = {}
+    for instance in instances:
+        model = type(instance)
+        if model not in fields_by_model:
+            fields_by_model[model] = [
+                (field, field.related_model.cached) for field in model._meta.concrete_fields
+                if field.is_relation and isinstance(getattr(field.related_model, 'cached', None), CachedLookup)
+            ]
+        for field, lookup in fields_by_model[model]:
+            value = getattr(instance, field.attname)
+            if value is not None:
+                setattr(instance, field.name, lookup.get(value))
+    return instances
@@ -0,0 +1,92 @@
+"""
+Per-food values derived from the SR tables, stored on `FoodDescription` by
+`import_usda` so that foods can be filtered and sorted by them in the
+database:
+
+- `energy_kcal`: protein, fat and carbohydrate (and alcohol) multiplied by the
+  food's calorie factors. Foods without factors, or without one of those
+  nutrients, use the reported energy value (nutrient 208) instead.
+- `edible_fraction`: `1 - refuse / 100`.
+- `serving_grams`: the gram weight of the food's first household measure.
+"""
+from decimal import Decimal
+
+from django.db import connection
+
+from . import models
+
+
+PROTEIN = '203'
+FAT = '204'
+CARBOHYDRATE = '205'
+ENERGY_KCAL = '208'
+ALCOHOL = '221'
+
+# kcal per gram of alcohol, as used by SR.
+ALCOHOL_FACTOR = Decimal('6.93')
+
+
+def quantizer(field_name):
+    return Decimal(1).scaleb(-models.FoodDescription._meta.get_field(field_name).decimal_places)
+
+
+def atwater_energy(factors, nutrients):
+    """
+    Return the energy in kcal per 100 g from `(protein_factor, fat_factor,
+    cho_factor)` and a dict of nutrient values, or None if it can't be
+    calculated.
+    """
+    components = [nutrients.get(PROTEIN), nutrients.get(FAT), nutrients.get(CARBOHYDRATE)]
+    if None in factors or None in components:
+        return None
+    energy = sum(factor * value for factor, value in zip(factors, components))
+    return energy + ALCOHOL_FACTOR * nutrients.get(ALCOHOL, 0)
+
+
+def food_values():
+    """
+    Yield `(energy_kcal, edible_fraction, serving_grams, ndb_no)` for every
+    food.
+    """
+    nutrients = {}
+    rows = models.NutrientData.objects.filter(
+        nutrient_definition_id__in=[PROTEIN, FAT, CARBOHYDRATE, ENERGY_KCAL, ALCOHOL]).values_list(
+        'food_description_id', 'nutrient_definition_id', 'nutrient_value')
+    for ndb_no, nutrient_number, value in rows.iterator():
+        nutrients.setdefault(ndb_no, {})[nutrient_number] = value
+    servings = dict(models.Weight.objects.filter(sequence=1).values_list('food_description_id', 'gram_weight'))
+
+    energy_quantum, fraction_quantum = quantizer('energy_kcal'), quantizer('edible_fraction')
+    foods = models.FoodDescription.objects.values_list(
+        'ndb_no', 'refuse', 'protein_factor', 'fat_factor', 'cho_factor')
+    for ndb_no, refuse, protein_factor, fat_factor, cho_factor in foods.iterator():
+        values = nutrients.get(ndb_no, {})
+        energy = atwater_energy((protein_factor, fat_factor, cho_factor), values)
+        if energy is None:
+            energy = values.get(ENERGY_KCAL)
+        yield (
+            None if energy is None else Decimal(energy).quantize(energy_quantum),
+            None if refuse is None else (1 - Decimal(refuse) / 100).quantize(fraction_quantum),
+            servings.get(ndb_no),
+            ndb_no,
+        )
+
+
+def update_food_values():
+    """
+    Store the derived values of the foods whose values have changed, and
+    return how many there were.
+    """
+    stored = {
+        row[-1]: row[:-1] for row in models.FoodDescription.objects.values_list(
+            'energy_kcal', 'edible_fraction', 'serving_grams', 'ndb_no').iterator()
+    }
+    changed = [row for row in food_values() if stored.get(row[-1]) != row[:-1]]
+    if not changed:
+        return 0
+    qn = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.executemany('UPDATE %s SET %s = %%s, %s = %%s, %s = %%s WHERE %s = %%s' % (
+            qn(models.FoodDescription._meta.db_table), qn('energy_kcal'), qn('edible_fraction'),
+            qn('serving_grams'), qn('ndb_no')), changed)
+    return len(changed)
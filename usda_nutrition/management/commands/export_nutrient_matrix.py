@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from usda_nutrition.matrix import NutrientMatrix
+
+
+class Command(BaseCommand):
+    help = 'Writes the nutrient values to a file that can be memory-mapped by usda_nutrition.matrix'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to write.')
+
+    def handle(self, *args, **options):
+        matrix = NutrientMatrix.from_database()
+        matrix.save(options['path'])
+        self.stdout.write('Wrote %d foods x %d nutrients to %s' % (
+            len(matrix.ndb_nos), len(matrix.nutrient_numbers), options['path']))
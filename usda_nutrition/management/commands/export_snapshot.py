@@ -0,0 +1,17 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from usda_nutrition.snapshot import write_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Writes the imported dataset to a binary snapshot that can be read with usda_nutrition.snapshot'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to write.')
+        parser.add_argument('--release', default='SR28', help='Release recorded in the snapshot (default: SR28).')
+
+    def handle(self, *args, **options):
+        write_snapshot(options['path'], release=options['release'])
+        self.stdout.write('Wrote %s (%d bytes)' % (options['path'], os.path.getsize(options['path'])))
@@ -1,111 +1,947 @@
 import csv
-import os
+import io
+import itertools
+import json
 import sys
+import time
+from decimal import ROUND_HALF_UP, Decimal
 
-from django.db import models, transaction
-from django.core.management.base import BaseCommand
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, connections, models, transaction
+from django.db.backends.utils import CursorWrapper
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.module_loading import import_string
 
 from usda_nutrition import models as usda
+from usda_nutrition.signals import data_imported
+from usda_nutrition.sources import get_source
 
-
-BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
-DATA_DIR = os.path.join(BASE_DIR, 'data/sr28')
+try:
+    import resource
+except ImportError:
+    resource = None
 
 
+# Each entry maps the columns of a data file onto model fields. Models are
+# given by label and only resolved when an import runs (see `input_files()`).
+# `key` names the fields that identify a row when syncing; it defaults to the
+# primary key. `optional` files are skipped when they aren't in the data
+# directory.
 INPUT_FILES = (
     {
         'filename': 'DERIV_CD.txt',
-        'model': usda.DerivationCode,
+        'model': 'usda_nutrition.DerivationCode',
         'fields': ['code', 'description']
     }, {
         'filename': 'FD_GROUP.txt',
-        'model': usda.FoodGroup,
+        'model': 'usda_nutrition.FoodGroup',
         'fields': ['code', 'description']
     }, {
         'filename': 'FOOD_DES.txt',
-        'model': usda.FoodDescription,
-        'fields': ['ndb_no', 'food_group_id', 'long_desc', 'short_desc', 'com_name', 'manufacturer_name', 'survey']
+        'model': 'usda_nutrition.FoodDescription',
+        'fields': [
+            'ndb_no', 'food_group_id', 'long_desc', 'short_desc', 'com_name', 'manufacturer_name', 'survey',
+            'refuse_description', 'refuse', 'scientific_name', 'nitrogen_factor', 'protein_factor', 'fat_factor',
+            'cho_factor'],
     }, {
         'filename': 'WEIGHT.txt',
-        'model': usda.Weight,
-        'fields': ['food_description_id', 'sequence', 'amount', 'measure_description', 'gram_weight', 'number_data_points', 'standard_deviation']
+        'model': 'usda_nutrition.Weight',
+        'fields': ['food_description_id', 'sequence', 'amount', 'measure_description', 'gram_weight', 'number_data_points', 'standard_deviation'],
+        'key': ['food_description_id', 'sequence']
     }, {
         'filename': 'SRC_CD.txt',
-        'model': usda.SourceCode,
+        'model': 'usda_nutrition.SourceCode',
         'fields': ['source_code', 'description']
     }, {
         'filename': 'NUTR_DEF.txt',
-        'model': usda.NutrientDefinition,
+        'model': 'usda_nutrition.NutrientDefinition',
         'fields': ['nutrient_number', 'units', 'tagname', 'nutrient_description', 'num_decimal_places', 'sort_order']
     }, {
         'filename': 'FOOTNOTE.txt',
-        'model': usda.Footnote,
-        'fields': ['food_description_id', 'footnote_no', 'footnote_type', 'nutrient_definition_id', 'footnote_text']
+        'model': 'usda_nutrition.Footnote',
+        'fields': ['food_description_id', 'footnote_no', 'footnote_type', 'nutrient_definition_id', 'footnote_text'],
+        'key': ['food_description_id', 'footnote_no', 'nutrient_definition_id']
+    }, {
+        'filename': 'NUT_DATA.txt',
+        'model': 'usda_nutrition.NutrientData',
+        'fields': ['food_description_id', 'nutrient_definition_id', 'nutrient_value', 'number_data_points', 'standard_error', 'source_code_id', 'derivation_code_id', 'ref_food_description_id', 'add_nutr_mark', 'num_studies', 'minimum', 'maximum', 'degrees_of_freedom', 'lower_error_bound', 'upper_error_bound', 'statistical_comments', 'modified_date', 'confidence_code'],
+        'key': ['food_description_id', 'nutrient_definition_id'],
+        # Not shipped with this package; imported when present.
+        'optional': True
     }
     # These tables aren't currently imported, as the corresponding models are
     # commented out of models.py.
-    # }, {
-    #     'filename': 'NUT_DATA.txt',
-    #     'model': usda.NutrientData,
-    #     'fields': ['food_description_id', 'nutrient_definition_id', 'nutrient_value', 'number_data_points', 'standard_error', 'source_code_id', 'derivation_code_id', 'ref_food_description_id', 'add_nutr_mark', 'num_studies', 'minimum', 'maximum', 'degrees_of_freedom', 'lower_error_bound', 'upper_error_bound', 'statistical_comments', 'modified_date', 'confidence_code']
-    # }, {
     # {
     #     'filename': 'DATA_SRC.txt',
-    #     'model': usda.DataSource,
+    #     'model': 'usda_nutrition.DataSource',
     #     'fields': ['datasrc_id', 'authors', 'title', 'year', 'journal', 'vol_city', 'issue_state', 'start_page', 'end_page']
     # }, {
     #     'filename': 'DATSRCLN.txt',
-    #     'model': usda.DataSourceLN,
+    #     'model': 'usda_nutrition.DataSourceLN',
     #     'fields': []
     # }, {
     #     'filename': 'LANGDESC.txt',
-    #     'model': usda.LanguaLDescription,
+    #     'model': 'usda_nutrition.LanguaLDescription',
     #     'fields': []
     # }, {
     #     'filename': 'LANGUAL.txt',
-    #     'model': usda.LanguaL,
+    #     'model': 'usda_nutrition.LanguaL',
     #     'fields': []
 )
 
 
-def value_for_field(field, value):
-    # Convert Y/N into a boolean.
-    if type(field) in [models.BooleanField, models.NullBooleanField]:
-        return {
-            'Y': True,
-            'N': False,
-            '': None
-        }[value]
+def input_files():
+    """
+    Return the `INPUT_FILES` entries with their models resolved to classes.
+    """
+    return [dict(info, model=apps.get_model(info['model'])) for info in INPUT_FILES]
+
+
+DEFAULT_BATCH_SIZE = 2000
+
+
+# Y/N flags in the data files map onto (Null)BooleanFields.
+BOOLEAN_VALUES = {
+    'Y': True,
+    'N': False,
+    '': None
+}
 
-    # Return the value, coercing empty strings to None.
+
+def to_bool(value):
+    return BOOLEAN_VALUES[value]
+
+
+def decimal_coercer(field):
+    """
+    Values are rounded to the field's decimal places here, rather than by
+    the database, so that every engine stores (and `--mode=sync` compares)
+    the same value.
+    """
+    exponent = Decimal(1).scaleb(-field.decimal_places)
+
+    def to_decimal(value):
+        return Decimal(value).quantize(exponent, ROUND_HALF_UP) if value else None
+    return to_decimal
+
+
+def to_int(value):
+    return int(value) if value else None
+
+
+def to_nullable_str(value):
     return value or None
 
-def import_file(filename, model_cls, field_list):
+
+def to_str(value):
+    return value
+
+
+def coercer_for_field(field):
+    """
+    Return the function used to convert a raw cell into a value for `field`.
+    Foreign keys are coerced according to the field they point to.
+    """
+    if field.is_relation:
+        target = field.target_field
+        return to_nullable_str if field.null else coercer_for_field(target)
+    if isinstance(field, (models.BooleanField, models.NullBooleanField)):
+        return to_bool
+    if isinstance(field, models.DecimalField):
+        return decimal_coercer(field)
+    if isinstance(field, models.IntegerField):
+        return to_int
+    return to_nullable_str if field.null else to_str
+
+
+def compile_coercers(model_cls, field_list):
+    """
+    Resolve the coercion function for each column of an `INPUT_FILES` entry.
+    This is done once per file rather than once per cell.
+    """
+    return tuple(
+        coercer_for_field(model_cls._meta.get_field(field))
+        for field in field_list
+    )
+
+
+def compile_builder(model_cls, field_list):
+    """
+    Return a function that builds an unsaved `model_cls` instance from a
+    tuple of converted values, with a single constructor call.
+
+    Values are passed positionally (in `concrete_fields` order), which is
+    Django's fast path for model instantiation. Columns that aren't in the
+    file are filled with the field's default.
+    """
+    concrete_fields = model_cls._meta.concrete_fields
+    attnames = [model_cls._meta.get_field(field).attname for field in field_list]
+    positions = tuple(
+        [f.attname for f in concrete_fields].index(attname)
+        for attname in attnames
+    )
+    template = [field.get_default() for field in concrete_fields[:max(positions) + 1]]
+
+    def build(values):
+        args = list(template)
+        for position, value in zip(positions, values):
+            args[position] = value
+        return model_cls(*args)
+    return build
+
+
+def compile_converter(model_cls, field_list):
+    """
+    Return a function that turns a raw row into an unsaved `model_cls`
+    instance.
+    """
+    coercers = compile_coercers(model_cls, field_list)
+    build = compile_builder(model_cls, field_list)
+
+    def convert(row):
+        return build([coerce(value) for coerce, value in zip(coercers, row)])
+    return convert
+
+
+def read_rows(filename, source=None):
+    """
+    Lazily yield the raw rows of a `^`-delimited, `~`-quoted SR data file
+    from `source` (see `usda_nutrition.sources`; default: `get_source()`).
+    """
+    with (source or get_source()).open(filename) as csvfile:
+        for row in csv.reader(csvfile, delimiter='^', quotechar='~'):
+            yield row
+
+
+def build_instances(rows, model_cls, field_list):
+    return map(compile_converter(model_cls, field_list), rows)
+
+
+def build_tuples(rows, model_cls, field_list):
+    coercers = compile_coercers(model_cls, field_list)
+    for row in rows:
+        yield tuple([coerce(value) for coerce, value in zip(coercers, row)])
+
+
+def batched(iterable, batch_size):
+    """
+    Group an iterable into lists of at most `batch_size` items, without
+    consuming more than one batch at a time.
+    """
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def load_orm(values, model_cls, field_list, batch_size):
+    """
+    Portable loader: build model instances and `bulk_create()` them.
+    """
+    build = compile_builder(model_cls, field_list)
+    count = 0
+    for batch in batched(map(build, values), batch_size):
+        model_cls.objects.bulk_create(batch)
+        count += len(batch)
+    return count
+
+
+def copy_text(value):
+    """
+    Format a value for PostgreSQL's COPY text format.
+    """
+    if value is None:
+        return '\\N'
+    if value is True:
+        return 't'
+    if value is False:
+        return 'f'
+    return (
+        str(value)
+        .replace('\\', '\\\\')
+        .replace('\t', '\\t')
+        .replace('\n', '\\n')
+        .replace('\r', '\\r')
+    )
+
+
+def copy_rows(table, columns, batches):
+    """
+    Write batches of value tuples straight into `table`, without creating
+    any model instances: a COPY stream on PostgreSQL and a raw
+    `executemany()` everywhere else.
+    """
+    quote_name = connection.ops.quote_name
+    column_sql = ', '.join(quote_name(column) for column in columns)
+    count = 0
+    with connection.cursor() as cursor:
+        for batch in batches:
+            if connection.vendor == 'postgresql':
+                stream = io.StringIO()
+                for values in batch:
+                    stream.write('\t'.join(map(copy_text, values)))
+                    stream.write('\n')
+                stream.seek(0)
+                cursor.copy_expert(
+                    'COPY %s (%s) FROM STDIN' % (quote_name(table), column_sql), stream)
+            else:
+                cursor.executemany('INSERT INTO %s (%s) VALUES (%s)' % (
+                    quote_name(table), column_sql, ', '.join(['%s'] * len(columns))
+                ), batch)
+            count += len(batch)
+    return count
+
+
+def load_copy(values, model_cls, field_list, batch_size, table=None):
+    """
+    Fast-path loader that bypasses the ORM, using the same field mapping.
+    """
+    columns = [model_cls._meta.get_field(field).column for field in field_list]
+    return copy_rows(table or model_cls._meta.db_table, columns, batched(values, batch_size))
+
+
+ENGINES = {
+    'orm': load_orm,
+    'copy': load_copy,
+}
+
+
+def available_input_files(source):
+    """
+    Return the `INPUT_FILES` entries to import, skipping optional files that
+    aren't present in `source`.
+    """
+    available = []
+    for info in input_files():
+        if info.get('optional') and not source.exists(info['filename']):
+            print('Skipping %s (not found in %s)' % (info['filename'], source))
+            continue
+        available.append(info)
+    return available
+
+
+def dependency_layers(input_files):
+    """
+    Group `input_files` into layers using the ForeignKeys between their
+    models: every entry only depends on entries in earlier layers, so the
+    entries within a layer can be imported independently.
+    """
+    models_in_files = {info['model'] for info in input_files}
+    dependencies = {
+        info['model']: {
+            field.related_model for field in info['model']._meta.concrete_fields
+            if field.is_relation and field.related_model in models_in_files
+            and field.related_model is not info['model']
+        }
+        for info in input_files
+    }
+
+    layers = []
+    done = set()
+    remaining = list(input_files)
+    while remaining:
+        layer = [info for info in remaining if dependencies[info['model']] <= done]
+        if not layer:
+            raise CommandError('Circular ForeignKey dependency between %s' % ', '.join(
+                info['filename'] for info in remaining))
+        layers.append(layer)
+        done.update(info['model'] for info in layer)
+        remaining = [info for info in remaining if info not in layer]
+    return layers
+
+
+def parse_file(filename, model_cls, field_list, source=None):
+    """
+    Read and convert a whole file. Runs in a worker process for `--jobs`.
+    """
+    return list(build_tuples(read_rows(filename, source), model_cls, field_list))
+
+
+def load_file(filename, model_cls, field_list, values, batch_size=DEFAULT_BATCH_SIZE, engine='orm'):
     sys.stdout.write('Importing %s... ' % filename)
     sys.stdout.flush()
 
-    path = os.path.join(DATA_DIR, filename)
-    with open(path, encoding='cp1252') as csvfile:
-        new_instances = []
-        reader = csv.reader(csvfile, delimiter='^', quotechar='~')
-        for row in reader:
-            new_instance = model_cls()
-            for index, field in enumerate(field_list):
-                value = value_for_field(model_cls._meta.get_field(field), row[index])
-                setattr(new_instance, field, value)
-            new_instances.append(new_instance)
-        model_cls.objects.bulk_create(new_instances)
+    start = time.time()
+    count = ENGINES[engine](values, model_cls, field_list, batch_size)
+    elapsed = time.time() - start
+
+    print('Done! %d rows in %.2fs (%d rows/sec)' % (
+        count, elapsed, count / elapsed if elapsed else 0))
+    return count
+
+
+def import_file(filename, model_cls, field_list, batch_size=DEFAULT_BATCH_SIZE, engine='orm', source=None):
+    values = build_tuples(read_rows(filename, source), model_cls, field_list)
+    return load_file(filename, model_cls, field_list, values, batch_size, engine)
+
+
+def timed(iterable, timings, stage):
+    """
+    Yield from `iterable`, adding the time spent waiting for each item to
+    `timings[stage]`.
+    """
+    iterator = iter(iterable)
+    clock = time.perf_counter
+    while True:
+        start = clock()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            timings[stage] += clock() - start
+            return
+        timings[stage] += clock() - start
+        yield item
+
+
+def peak_rss():
+    """
+    Return the peak resident set size of this process in bytes, or None if
+    it can't be measured here.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class CountingCursorWrapper(CursorWrapper):
+    def __init__(self, cursor, db, counter):
+        super(CountingCursorWrapper, self).__init__(cursor, db)
+        self.counter = counter
+
+    def execute(self, sql, params=None):
+        self.counter.count += 1
+        return self.cursor.execute(sql, params)
+
+    def executemany(self, sql, param_list):
+        self.counter.count += 1
+        return self.cursor.executemany(sql, param_list)
+
+    def copy_expert(self, sql, file, *args):
+        self.counter.count += 1
+        return self.cursor.copy_expert(sql, file, *args)
+
 
-    print('Done!')
+class QueryCounter(object):
+    """
+    Count the queries run over `connection` while active. Where Django lets
+    the connection's cursors be wrapped (1.11 and later), this doesn't turn
+    on the query log, which keeps every statement and, on SQLite, runs extra
+    queries to render them. Older versions count the query log instead.
+    """
+    def __init__(self, connection):
+        # The wrapper itself, rather than the `django.db.connection` proxy,
+        # whose attributes are its own.
+        self.connection = connections[connection.alias]
+        self.count = 0
+        self.wrap_cursors = hasattr(connection, '_prepare_cursor')
+
+    def __enter__(self):
+        if self.wrap_cursors:
+            # Whatever the instance itself set, if anything, is put back on
+            # exit.
+            self.previous = self.connection.__dict__.get('_prepare_cursor')
+            prepare_cursor = self.connection._prepare_cursor
+            self.connection._prepare_cursor = lambda cursor: CountingCursorWrapper(
+                prepare_cursor(cursor), self.connection, self)
+        else:
+            self.previous = self.connection.force_debug_cursor
+            self.connection.force_debug_cursor = True
+            self.logged = len(self.connection.queries_log)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.wrap_cursors:
+            if self.previous is None:
+                del self.connection._prepare_cursor
+            else:
+                self.connection._prepare_cursor = self.previous
+        else:
+            self.count = len(self.connection.queries_log) - self.logged
+            self.connection.force_debug_cursor = self.previous
+
+
+class ImportProfile(object):
+    """
+    Per-file stage timings of a serial import, for `--profile`.
+
+    Each file is split into three stages: parse (reading and decoding the
+    file), convert (coercing values to Python types) and write (everything
+    the engine does, including building model instances for "orm").
+    """
+    def __init__(self, batch_size, engine):
+        self.batch_size = batch_size
+        self.engine = engine
+        self.files = []
+        self.stages = []
+
+    def import_file(self, filename, model_cls, field_list, batch_size=DEFAULT_BATCH_SIZE, engine='orm', source=None):
+        timings = {'parse': 0.0, 'convert': 0.0}
+        rows = timed(read_rows(filename, source), timings, 'parse')
+        values = timed(build_tuples(rows, model_cls, field_list), timings, 'convert')
+        with QueryCounter(connection) as queries:
+            start = time.perf_counter()
+            count = load_file(filename, model_cls, field_list, values, batch_size, engine)
+            elapsed = time.perf_counter() - start
+        self.files.append({
+            'filename': filename,
+            'rows': count,
+            'seconds': elapsed,
+            'rows_per_sec': count / elapsed if elapsed else 0,
+            # The timed iterators are nested, so each includes the stages
+            # it pulls from.
+            'parse': timings['parse'],
+            'convert': timings['convert'] - timings['parse'],
+            'write': elapsed - timings['convert'],
+            'queries': queries.count,
+            'peak_rss': peak_rss(),
+        })
+        return count
+
+    def as_dict(self):
+        return {
+            'vendor': connection.vendor,
+            'engine': self.engine,
+            'batch_size': self.batch_size,
+            'files': self.files,
+            'post_import': self.stages,
+            'seconds': sum(info['seconds'] for info in self.files) + sum(
+                stage['seconds'] for stage in self.stages),
+            'peak_rss': peak_rss(),
+        }
+
+    def report(self):
+        print('%-14s %8s %8s %8s %8s %8s %10s %8s %9s' % (
+            'file', 'rows', 'parse', 'convert', 'write', 'total', 'rows/sec', 'queries', 'rss (MB)'))
+        for info in self.files:
+            print('%-14s %8d %8.2f %8.2f %8.2f %8.2f %10d %8d %9s' % (
+                info['filename'], info['rows'], info['parse'], info['convert'], info['write'],
+                info['seconds'], info['rows_per_sec'], info['queries'],
+                '%.1f' % (info['peak_rss'] / 1e6) if info['peak_rss'] else '-'))
+
+
+def staging_table(model_cls):
+    return '%s__staging' % model_cls._meta.db_table
+
+
+def stage_file(info, values, batch_size):
+    """
+    Load parsed values into a staging copy of the model's table. Runs in its
+    own thread, and so over its own database connection.
+    """
+    model_cls = info['model']
+    quote_name = connection.ops.quote_name
+    try:
+        with connection.cursor() as cursor:
+            # A killed run can leave its staging table behind.
+            cursor.execute('DROP TABLE IF EXISTS %s' % quote_name(staging_table(model_cls)))
+            cursor.execute('CREATE TABLE %s (LIKE %s INCLUDING DEFAULTS)' % (
+                quote_name(staging_table(model_cls)), quote_name(model_cls._meta.db_table)))
+        return load_copy(values, model_cls, info['fields'], batch_size, table=staging_table(model_cls))
+    finally:
+        connection.close()
+
+
+def swap_in(input_files):
+    """
+    Move every staged table into place within a single transaction.
+    """
+    quote_name = connection.ops.quote_name
+    with transaction.atomic(), connection.cursor() as cursor:
+        for info in input_files:
+            model_cls = info['model']
+            columns = ', '.join(
+                quote_name(model_cls._meta.get_field(field).column) for field in info['fields'])
+            cursor.execute('INSERT INTO %s (%s) SELECT %s FROM %s' % (
+                quote_name(model_cls._meta.db_table), columns,
+                columns, quote_name(staging_table(model_cls))))
+
+
+def drop_staging_tables(input_files):
+    with connection.cursor() as cursor:
+        for info in input_files:
+            cursor.execute('DROP TABLE IF EXISTS %s' % connection.ops.quote_name(
+                staging_table(info['model'])))
+
+
+def parse_pool(jobs):
+    """
+    Return a process pool to parse files in. Workers are started with the
+    platform's default method and run `django.setup()` before parsing, since
+    spawned ones start without it. Python 3.6 and earlier can't set up
+    workers that way, so the files are parsed in this process instead.
+    """
+    from concurrent.futures import Executor, Future, ProcessPoolExecutor
+
+    if sys.version_info >= (3, 7):
+        import django
+
+        return ProcessPoolExecutor(max_workers=jobs, initializer=django.setup)
+
+    class InlineExecutor(Executor):
+        def submit(self, fn, *args, **kwargs):
+            future = Future()
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+
+    print('Parsing files one at a time: worker processes need Python 3.7 or later.')
+    return InlineExecutor()
+
+
+def run_parallel(batch_size=DEFAULT_BATCH_SIZE, engine='orm', jobs=2, source=None):
+    """
+    Import the files layer by layer, parsing each layer's files in a process
+    pool (see `parse_pool()`). With the "copy" engine on PostgreSQL, the
+    parsed tables are also loaded concurrently, each over its own connection
+    into a staging table with COPY, and swapped in at the end; otherwise they
+    are loaded with `engine` one after another inside one transaction.
+    """
+    source = source or get_source()
+    layers = dependency_layers(available_input_files(source))
+    concurrent_load = connection.vendor == 'postgresql' and engine == 'copy'
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    with parse_pool(jobs) as pool:
+        def parse_layer(layer):
+            return pool.map(parse_file, *zip(*(
+                (info['filename'], info['model'], info['fields'], source) for info in layer)))
+
+        if not concurrent_load:
+            with transaction.atomic():
+                for layer in layers:
+                    for info, values in zip(layer, parse_layer(layer)):
+                        load_file(
+                            info['filename'], info['model'], info['fields'], values,
+                            batch_size=batch_size, engine=engine)
+            return
+
+        try:
+            with ThreadPoolExecutor(max_workers=jobs) as threads:
+                for layer in layers:
+                    staged = [
+                        threads.submit(stage_file, info, values, batch_size)
+                        for info, values in zip(layer, parse_layer(layer))
+                    ]
+                    for info, future in zip(layer, staged):
+                        print('Staged %s: %d rows' % (info['filename'], future.result()))
+            swap_in([info for layer in layers for info in layer])
+        finally:
+            drop_staging_tables([info for layer in layers for info in layer])
+        print('Done!')
+
+
+# SQLite added `INSERT ... ON CONFLICT DO UPDATE` in 3.24.0.
+SQLITE_UPSERT_VERSION = (3, 24, 0)
+
+
+def check_upsert_support():
+    if connection.vendor == 'sqlite' and connection.Database.sqlite_version_info < SQLITE_UPSERT_VERSION:
+        raise CommandError('--mode=sync needs SQLite %s or later; this is SQLite %s.' % (
+            '.'.join(map(str, SQLITE_UPSERT_VERSION)), connection.Database.sqlite_version))
+
+
+def upsert_rows(table, pk_column, columns, batches):
+    """
+    Insert or overwrite rows by primary key, a batch per query. See
+    `check_upsert_support()`.
+    """
+    quote_name = connection.ops.quote_name
+    if connection.vendor == 'mysql':
+        conflict_sql = 'ON DUPLICATE KEY UPDATE %s' % ', '.join(
+            '%s = VALUES(%s)' % (quote_name(column), quote_name(column))
+            for column in columns if column != pk_column)
+    else:
+        conflict_sql = 'ON CONFLICT (%s) DO UPDATE SET %s' % (quote_name(pk_column), ', '.join(
+            '%s = excluded.%s' % (quote_name(column), quote_name(column))
+            for column in columns if column != pk_column))
+    sql = 'INSERT INTO %s (%s) VALUES (%s) %s' % (
+        quote_name(table), ', '.join(quote_name(column) for column in columns),
+        ', '.join(['%s'] * len(columns)), conflict_sql)
+
+    count = 0
+    with connection.cursor() as cursor:
+        for batch in batches:
+            cursor.executemany(sql, batch)
+            count += len(batch)
+    return count
+
+
+def sync_file(info, batch_size=DEFAULT_BATCH_SIZE, engine='orm', source=None):
+    """
+    Insert and update the rows of one table that differ from its data file.
+
+    Stored rows are indexed by their key, keeping only the primary key and a
+    hash of the row; each source row is then hashed and compared as it is
+    read. Returns `(inserted, updated, deleted)`: the counts of inserted and
+    updated rows, and the primary keys of stored rows that are missing from
+    the file. Those are not deleted here, so that the caller can delete them
+    once the tables that depend on this one have been synced. Keys must be
+    unique, in the table and in the file: nothing enforces that for
+    footnotes, and a repeated key would be inserted again on every sync.
+    """
+    model_cls, field_list = info['model'], info['fields']
+    pk_field = model_cls._meta.pk
+    key_index = [field_list.index(field) for field in info.get('key', [pk_field.attname])]
+
+    def duplicate_key(where, key):
+        return CommandError(
+            '%s has more than one row with the key %r; --mode=sync needs the keys to be unique.' % (where, key))
+
+    stored = {}
+    for row in model_cls.objects.values_list(pk_field.attname, *field_list).iterator():
+        values = row[1:]
+        key = tuple(values[index] for index in key_index)
+        if key in stored:
+            raise duplicate_key(model_cls._meta.db_table, key)
+        stored[key] = (row[0], hash(values))
+
+    # Updates are written with the primary key as their first column.
+    update_fields = list(field_list)
+    if pk_field.attname in field_list:
+        def update_values(pk, values):
+            return values
+    else:
+        update_fields.insert(0, pk_field.attname)
+
+        def update_values(pk, values):
+            return (pk,) + values
+    update_columns = [model_cls._meta.get_field(field).column for field in update_fields]
+
+    inserts, updates = [], []
+    inserted = updated = unchanged = 0
+    seen = set()
+    for values in build_tuples(read_rows(info['filename'], source), model_cls, field_list):
+        key = tuple(values[index] for index in key_index)
+        if key in seen:
+            raise duplicate_key(info['filename'], key)
+        seen.add(key)
+        match = stored.pop(key, None)
+        if match is None:
+            inserts.append(values)
+        elif match[1] != hash(values):
+            updates.append(update_values(match[0], values))
+        else:
+            unchanged += 1
+
+        if len(inserts) >= batch_size:
+            inserted += ENGINES[engine](inserts, model_cls, field_list, batch_size)
+            inserts = []
+        if len(updates) >= batch_size:
+            updated += upsert_rows(model_cls._meta.db_table, pk_field.column, update_columns, [updates])
+            updates = []
+    if inserts:
+        inserted += ENGINES[engine](inserts, model_cls, field_list, batch_size)
+    if updates:
+        updated += upsert_rows(model_cls._meta.db_table, pk_field.column, update_columns, [updates])
+
+    deleted = [pk for pk, row_hash in stored.values()]
+    print('Synced %s: %d inserted, %d updated, %d deleted, %d unchanged' % (
+        info['filename'], inserted, updated, len(deleted), unchanged))
+    return inserted, updated, deleted
+
+
+@transaction.atomic
+def run_sync(batch_size=DEFAULT_BATCH_SIZE, engine='orm', source=None):
+    """
+    Apply only the differences between the data files and the stored tables,
+    in a single transaction. Inserts and updates follow the ForeignKey
+    dependencies between tables; deletes run in the reverse order. Returns
+    the number of rows changed.
+    """
+    check_upsert_support()
+    source = source or get_source()
+    ordered = [info for layer in dependency_layers(available_input_files(source)) for info in layer]
+    changed = 0
+    deletions = []
+    for info in ordered:
+        inserted, updated, pks = sync_file(info, batch_size=batch_size, engine=engine, source=source)
+        changed += inserted + updated + len(pks)
+        deletions.append((info, pks))
+    for info, pks in reversed(deletions):
+        model_cls = info['model']
+        delete_batch_size = connection.ops.bulk_batch_size([model_cls._meta.pk], pks) or len(pks)
+        for batch in batched(pks, min(batch_size, delete_batch_size)):
+            model_cls.objects.filter(pk__in=batch).delete()
+    return changed
 
 
 @transaction.atomic
-def run():
-    for info in INPUT_FILES:
-        import_file(info['filename'], info['model'], info['fields'])
+def run_serial(batch_size=DEFAULT_BATCH_SIZE, engine='orm', profile=None, source=None):
+    source = source or get_source()
+    load = profile.import_file if profile else import_file
+    for info in available_input_files(source):
+        load(info['filename'], info['model'], info['fields'], batch_size=batch_size, engine=engine, source=source)
+
+
+def bump_version():
+    """
+    Record the import in the `DataVersion` stamp that processes holding
+    cached data compare against.
+    """
+    stamp, _ = usda.DataVersion.objects.get_or_create(pk=1)
+    stamp.version += 1
+    stamp.imported_at = timezone.now()
+    stamp.save()
+
+
+def save_nutrient_matrix():
+    """
+    Rewrite the nutrient matrix file at `USDA_NUTRITION_MATRIX_PATH`, if that
+    is set, so that other processes map the new values once they see the new
+    data version. Only then is NumPy needed.
+    """
+    path = getattr(settings, 'USDA_NUTRITION_MATRIX_PATH', None)
+    if path:
+        from usda_nutrition.matrix import NutrientMatrix
+
+        NutrientMatrix.from_database().save(path)
+
+
+def save_similarity_index():
+    """
+    Save the similar foods index to `USDA_NUTRITION_SIMILARITY_PATH`, if that
+    is set. Only then is NumPy needed.
+    """
+    path = getattr(settings, 'USDA_NUTRITION_SIMILARITY_PATH', None)
+    if path:
+        from usda_nutrition.matrix import NutrientMatrix
+        from usda_nutrition.similarity import SimilarityIndex
+
+        SimilarityIndex.from_matrix(NutrientMatrix.from_database()).save(path)
+
+
+# Derived data rebuilt after the tables are loaded, as (description, dotted
+# path of a function), so that their modules are only imported when they run.
+POST_IMPORT_STAGES = (
+    ('derived food values', 'usda_nutrition.derived.update_food_values'),
+    ('search index', 'usda_nutrition.search.build_index'),
+    ('food profiles', 'usda_nutrition.profiles.build_profiles'),
+)
+
+# Files are only written from committed tables, and the data version is
+# bumped after them, so that no process loads an old file under the new
+# version.
+POST_COMMIT_STAGES = (
+    ('nutrient matrix', 'usda_nutrition.management.commands.import_usda.save_nutrient_matrix'),
+    ('similarity index', 'usda_nutrition.management.commands.import_usda.save_similarity_index'),
+    ('data version', 'usda_nutrition.management.commands.import_usda.bump_version'),
+)
+
+
+def post_import(stages, profile=None):
+    for description, stage in stages:
+        sys.stdout.write('Building %s... ' % description)
+        sys.stdout.flush()
+        start = time.time()
+        import_string(stage)()
+        elapsed = time.time() - start
+        print('Done! (%.2fs)' % elapsed)
+        if profile:
+            profile.stages.append({'stage': description, 'seconds': elapsed})
+
+
+def run(batch_size=DEFAULT_BATCH_SIZE, engine='orm', jobs=1, mode='full', profile=None, source=None):
+    """
+    Import every input file from `source` (default: `get_source()`). Pass an
+    `ImportProfile` as `profile` to record per-stage timings; it requires a
+    serial, full import. A sync that changes nothing leaves the derived data
+    and the data version as they are.
+    """
+    if mode == 'sync' and jobs > 1:
+        raise CommandError('--jobs is not supported with --mode=sync.')
+    if profile and (mode != 'full' or jobs > 1):
+        raise CommandError('Stage timings are only recorded for --mode=full with --jobs=1.')
+    with transaction.atomic():
+        if mode == 'sync':
+            if not run_sync(batch_size=batch_size, engine=engine, source=source):
+                print('No changes.')
+                return
+        elif jobs > 1:
+            run_parallel(batch_size=batch_size, engine=engine, jobs=jobs, source=source)
+        else:
+            run_serial(batch_size=batch_size, engine=engine, profile=profile, source=source)
+        post_import(POST_IMPORT_STAGES, profile)
+    post_import(POST_COMMIT_STAGES, profile)
+    data_imported.send(sender=usda.DataVersion, version=usda.DataVersion.objects.get(pk=1).version)
+
 
 class Command(BaseCommand):
     help = 'Imports the USDA Nutrition Database (version SR28)'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+            help='Number of rows to insert per query (default: %d).' % DEFAULT_BATCH_SIZE)
+        parser.add_argument(
+            '--engine', choices=sorted(ENGINES), default='orm',
+            help='"orm" loads through model instances and bulk_create(); '
+                 '"copy" writes rows directly with COPY (PostgreSQL) or '
+                 'executemany() (other backends).')
+        parser.add_argument(
+            '--jobs', type=int, default=1,
+            help='Number of files to parse (and, with --engine=copy on '
+                 'PostgreSQL, load) in parallel, following the ForeignKey '
+                 'dependencies between tables (default: 1).')
+        parser.add_argument(
+            '--mode', choices=['full', 'sync'], default='full',
+            help='"full" imports into empty tables; "sync" compares the files '
+                 'with the stored rows and only applies the inserts, updates '
+                 'and deletes needed to bring them in line.')
+        parser.add_argument(
+            '--profile', nargs='?', const='stages', choices=['stages', 'cprofile'],
+            help='"stages" (the default) reports parse, convert and write '
+                 'times, rows/sec, query counts and peak memory per file; '
+                 '"cprofile" runs the import under cProfile.')
+        parser.add_argument(
+            '--profile-output', metavar='PATH',
+            help='Write the stage timings as JSON, or the cProfile stats, to '
+                 'PATH instead of printing them.')
+        parser.add_argument(
+            '--data-dir', metavar='PATH',
+            help='Import from the data files in PATH, a directory (the files '
+                 'may be gzip-compressed) or a zip archive such as the USDA\'s '
+                 'sr28asc.zip (default: the USDA_NUTRITION_DATA_DIR setting, '
+                 'or the data shipped with this package).')
+
     def handle(self, *args, **options):
-        run()
+        try:
+            source = get_source(options['data_dir'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        kwargs = {
+            'batch_size': options['batch_size'],
+            'engine': options['engine'],
+            'jobs': options['jobs'],
+            'mode': options['mode'],
+            'source': source,
+        }
+        output = options['profile_output']
+        if options['profile'] == 'stages':
+            profile = ImportProfile(options['batch_size'], options['engine'])
+            run(profile=profile, **kwargs)
+            if output:
+                with open(output, 'w') as f:
+                    json.dump(profile.as_dict(), f, indent=2)
+            else:
+                profile.report()
+        elif options['profile'] == 'cprofile':
+            import cProfile
+            import pstats
+
+            profiler = cProfile.Profile()
+            profiler.runcall(run, **kwargs)
+            if output:
+                profiler.dump_stats(output)
+            else:
+                pstats.Stats(profiler, stream=self.stdout).sort_stats('cumulative').print_stats(25)
+        else:
+            run(**kwargs)
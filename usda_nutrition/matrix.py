@@ -0,0 +1,275 @@
+"""
+A read-only, array-backed view of the nutrient values: one row per food, one
+column per nutrient, with values per 100 g of edible portion. Nutrients that
+SR doesn't report for a food are NaN: they fail every `find()` constraint,
+sort last and are left out of `profile()`, while `totals()` counts them as 0.
+
+Requires NumPy (`pip install django-usda-nutrition[matrix]`).
+
+Typical use:
+
+    from usda_nutrition.matrix import get_matrix
+
+    matrix = get_matrix()
+    totals = matrix.totals([('01001', 14.2), ('09003', 182)])
+    protein = totals[matrix.nutrient_index['203']]
+
+`find_foods()` answers range and ranking queries, such as "protein over 20 g
+and fat under 5 g, highest fibre first", in a single pass over the matrix:
+
+    from usda_nutrition.matrix import find_foods
+
+    find_foods({'PROCNT__gt': 20, 'FAT__lt': 5}, order_by='-FIBTG', limit=10)
+
+`get_matrix()` builds the matrix once per process, and again after each
+import. If the `USDA_NUTRITION_MATRIX_PATH` setting names a file written by
+`./manage.py export_nutrient_matrix`, it is memory-mapped instead of being
+built from the database, so that worker processes share its pages;
+`import_usda` rewrites that file.
+"""
+import json
+import operator
+import os
+import struct
+
+import numpy as np
+from django.conf import settings
+
+from . import models
+from .cache import versioned
+
+
+MAGIC = b'USDAMTX1'
+HEADER_LENGTH = struct.Struct('<Q')
+ALIGNMENT = 64
+
+LOOKUPS = {
+    'exact': operator.eq,
+    'gt': operator.gt,
+    'gte': operator.ge,
+    'lt': operator.lt,
+    'lte': operator.le,
+}
+
+
+def split_lookup(key):
+    """
+    Split `'203__gte'` into `('203', 'gte')`. Keys without a lookup are exact.
+    """
+    nutrient, _, lookup = key.rpartition('__')
+    if nutrient and (lookup in LOOKUPS or lookup == 'range'):
+        return nutrient, lookup
+    return key, 'exact'
+
+
+class NutrientMatrix(object):
+    def __init__(self, ndb_nos, nutrient_numbers, values):
+        self.ndb_nos = list(ndb_nos)
+        self.nutrient_numbers = list(nutrient_numbers)
+        self.values = values
+        self.food_index = {ndb_no: index for index, ndb_no in enumerate(self.ndb_nos)}
+        self.nutrient_index = {number: index for index, number in enumerate(self.nutrient_numbers)}
+
+    @classmethod
+    def from_database(cls):
+        ndb_nos = list(models.FoodDescription.objects.order_by('pk').values_list('pk', flat=True))
+        nutrient_numbers = list(models.NutrientDefinition.objects.order_by(
+            'sort_order', 'pk').values_list('pk', flat=True))
+        matrix = cls(ndb_nos, nutrient_numbers, np.full((len(ndb_nos), len(nutrient_numbers)), np.nan))
+
+        rows = models.NutrientData.objects.values_list(
+            'food_description_id', 'nutrient_definition_id', 'nutrient_value').iterator()
+        food_index, nutrient_index = matrix.food_index, matrix.nutrient_index
+        for ndb_no, nutrient_number, value in rows:
+            matrix.values[food_index[ndb_no], nutrient_index[nutrient_number]] = value
+        return matrix
+
+    def save(self, path):
+        """
+        Write the matrix to a single file: a magic number, a JSON header with
+        the index maps, then the raw values, aligned so they can be mapped.
+        An existing file is replaced atomically, so processes that have it
+        mapped keep their copy.
+        """
+        values = np.ascontiguousarray(self.values, dtype='<f8')
+        header = json.dumps({
+            'ndb_nos': self.ndb_nos,
+            'nutrient_numbers': self.nutrient_numbers,
+            'dtype': values.dtype.str,
+            'shape': values.shape,
+        }).encode('utf-8')
+        offset = len(MAGIC) + HEADER_LENGTH.size + len(header)
+        padding = -offset % ALIGNMENT
+        temporary = '%s.tmp' % path
+        with open(temporary, 'wb') as f:
+            f.write(MAGIC)
+            f.write(HEADER_LENGTH.pack(len(header) + padding))
+            f.write(header + b' ' * padding)
+            f.write(values.tobytes())
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        with open(path, 'rb') as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError('%s is not a nutrient matrix file.' % path)
+            header_length, = HEADER_LENGTH.unpack(f.read(HEADER_LENGTH.size))
+            header = json.loads(f.read(header_length).decode('utf-8'))
+            offset = f.tell()
+            if not mmap:
+                values = np.fromfile(f, dtype=header['dtype']).reshape(header['shape'])
+        if mmap:
+            values = np.memmap(
+                path, dtype=header['dtype'], mode='r', offset=offset, shape=tuple(header['shape']))
+        return cls(header['ndb_nos'], header['nutrient_numbers'], values)
+
+    def food_indices(self, ndb_nos):
+        food_index = self.food_index
+        return np.fromiter((food_index[ndb_no] for ndb_no in ndb_nos), dtype=np.intp)
+
+    def value(self, ndb_no, nutrient_number):
+        """
+        Return a food's value for a nutrient, or None if SR doesn't report it.
+        """
+        value = float(self.values[self.food_index[ndb_no], self.nutrient_index[nutrient_number]])
+        return None if np.isnan(value) else value
+
+    def profile(self, ndb_no):
+        """
+        Return the nutrient values per 100 g of a food, keyed by nutrient
+        number, leaving out the nutrients SR doesn't report for it.
+        """
+        return {
+            number: value for number, value in zip(self.nutrient_numbers, self.values[self.food_index[ndb_no]].tolist())
+            if not np.isnan(value)
+        }
+
+    def find(self, constraints, order_by=None, limit=None):
+        """
+        Return the `ndb_no`s of the foods whose values satisfy every
+        constraint, as a dict of `{'nutrient_number__lookup': value}` where
+        lookup is one of exact (the default), gt, gte, lt, lte or range (an
+        inclusive `(low, high)` pair).
+
+        `order_by` is a nutrient number or a list of them, each optionally
+        prefixed with '-' for descending order; ties keep `ndb_no` order.
+        Foods without a value for a constrained nutrient never match, and
+        those without a value for a sort key come last.
+        """
+        mask = np.ones(len(self.ndb_nos), dtype=bool)
+        # Comparisons with NaN are False, which is what excludes the foods
+        # without a value.
+        with np.errstate(invalid='ignore'):
+            for key, value in constraints.items():
+                number, lookup = split_lookup(key)
+                column = self.values[:, self.nutrient_index[number]]
+                if lookup == 'range':
+                    low, high = value
+                    mask &= (column >= low) & (column <= high)
+                else:
+                    mask &= LOOKUPS[lookup](column, value)
+        indices = np.flatnonzero(mask)
+
+        if order_by:
+            if isinstance(order_by, str):
+                order_by = [order_by]
+            # np.lexsort sorts by its last key first, and NaN after every
+            # number, whether or not the key is negated.
+            sort_keys = []
+            for key in reversed(order_by):
+                column = self.values[indices, self.nutrient_index[key.lstrip('-')]]
+                sort_keys.append(-column if key.startswith('-') else column)
+            indices = indices[np.lexsort(sort_keys)]
+        if limit is not None:
+            indices = indices[:limit]
+        return [self.ndb_nos[index] for index in indices]
+
+    def totals(self, items):
+        """
+        Sum the nutrients for an iterable of `(ndb_no, grams)` pairs. Returns
+        an array aligned with `nutrient_numbers`. Values SR doesn't report
+        count as 0.
+        """
+        items = list(items)
+        ndb_nos, grams = zip(*items) if items else ((), ())
+        weights = np.asarray(grams, dtype=float) / 100
+        return weights @ np.nan_to_num(self.values[self.food_indices(ndb_nos)])
+
+    def totals_many(self, recipes):
+        """
+        Sum the nutrients of several recipes, each an iterable of
+        `(ndb_no, grams)` pairs, in one pass. Returns an array with one row
+        per recipe, aligned with `nutrient_numbers`. Values SR doesn't report
+        count as 0.
+        """
+        recipes = list(recipes)
+        recipe_ids, ndb_nos, grams = [], [], []
+        for recipe_id, items in enumerate(recipes):
+            for ndb_no, weight in items:
+                recipe_ids.append(recipe_id)
+                ndb_nos.append(ndb_no)
+                grams.append(weight)
+
+        contributions = np.nan_to_num(self.values[self.food_indices(ndb_nos)]) * (np.asarray(grams, dtype=float) / 100)[:, None]
+        totals = np.zeros((len(recipes), len(self.nutrient_numbers)))
+        np.add.at(totals, np.asarray(recipe_ids, dtype=np.intp), contributions)
+        return totals
+
+
+@versioned
+def get_matrix():
+    """
+    Return the process-wide matrix, from `USDA_NUTRITION_MATRIX_PATH` if that
+    is set.
+    """
+    path = getattr(settings, 'USDA_NUTRITION_MATRIX_PATH', None)
+    return NutrientMatrix.load(path) if path else NutrientMatrix.from_database()
+
+
+clear_matrix = get_matrix.clear
+
+
+def nutrient_number(key):
+    """
+    Return the nutrient number for a nutrient number or tagname (such as
+    'PROCNT'), using the cached nutrient definitions.
+    """
+    definitions = models.NutrientDefinition.cached.as_dict()
+    if key in definitions:
+        return key
+    for number, definition in definitions.items():
+        if definition.tagname and definition.tagname.upper() == key.upper():
+            return number
+    raise KeyError('Unknown nutrient: %s' % key)
+
+
+def find_foods(constraints, order_by=None, limit=None):
+    """
+    Return the foods matching `constraints`, as `NutrientMatrix.find()` does,
+    but accepting tagnames as well as nutrient numbers. Each food has a
+    `nutrient_values` dict with its values for the nutrients used, keyed as
+    they were given, and None for those SR doesn't report.
+    """
+    matrix = get_matrix()
+    keys = {}
+    numbered_constraints = {}
+    for key, value in constraints.items():
+        nutrient, lookup = split_lookup(key)
+        keys[nutrient] = nutrient_number(nutrient)
+        numbered_constraints['%s__%s' % (keys[nutrient], lookup)] = value
+    if isinstance(order_by, str):
+        order_by = [order_by]
+    numbered_order_by = []
+    for key in order_by or []:
+        nutrient = key.lstrip('-')
+        keys[nutrient] = nutrient_number(nutrient)
+        numbered_order_by.append(key.replace(nutrient, keys[nutrient]))
+
+    ndb_nos = matrix.find(numbered_constraints, numbered_order_by, limit)
+    foods = models.FoodDescription.objects.in_bulk(ndb_nos)
+    results = []
+    for ndb_no in ndb_nos:
+        food = foods[ndb_no]
+        food.nutrient_values = {key: matrix.value(ndb_no, number) for key, number in keys.items()}
+        results.append(food)
+    return results
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import OperationalError, migrations
+
+
+TABLE = 'usda_nutrition_foodsearch'
+
+
+def create_search_table(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE TABLE %s (ndb_no varchar(5) PRIMARY KEY, food_group_id varchar(4) NOT NULL, '
+            'document tsvector NOT NULL)' % TABLE)
+        schema_editor.execute('CREATE INDEX %s_document ON %s USING GIN (document)' % (TABLE, TABLE))
+        schema_editor.execute('CREATE INDEX %s_food_group_id ON %s (food_group_id)' % (TABLE, TABLE))
+    elif vendor == 'sqlite':
+        # SQLite builds without FTS5 fall back to the in-memory search index.
+        try:
+            with schema_editor.connection.cursor() as cursor:
+                cursor.execute(
+                    'CREATE VIRTUAL TABLE %s USING fts5(ndb_no UNINDEXED, food_group_id UNINDEXED, '
+                    'long_desc, short_desc, com_name)' % TABLE)
+        except OperationalError:
+            pass
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor in ('postgresql', 'sqlite'):
+        schema_editor.execute('DROP TABLE IF EXISTS %s' % TABLE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usda_nutrition', '0003_nutrientdata'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
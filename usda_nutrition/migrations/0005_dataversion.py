@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 16:46
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usda_nutrition', '0004_food_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataVersion',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(default=0, help_text='Incremented by each run of import_usda, so that long-running processes can tell their cached data is out of date.')),
+                ('imported_at', models.DateTimeField(blank=True, help_text='When import_usda last completed.', null=True)),
+            ],
+        ),
+    ]
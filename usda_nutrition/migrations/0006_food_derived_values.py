@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 16:54
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usda_nutrition', '0005_dataversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fooddescription',
+            name='edible_fraction',
+            field=models.DecimalField(blank=True, decimal_places=3, help_text='Fraction of the food as purchased that is edible, from the percentage of refuse.', max_digits=4, null=True),
+        ),
+        migrations.AddField(
+            model_name='fooddescription',
+            name='energy_kcal',
+            field=models.DecimalField(blank=True, db_index=True, decimal_places=2, help_text='Energy in kcal per 100 grams, edible portion, calculated from the protein, fat and carbohydrate factors (or the reported energy value, for foods without factors).', max_digits=7, null=True),
+        ),
+        migrations.AddField(
+            model_name='fooddescription',
+            name='serving_grams',
+            field=models.DecimalField(blank=True, decimal_places=1, help_text='Gram weight of the first household measure (Weight sequence 1).', max_digits=8, null=True),
+        ),
+        migrations.AlterIndexTogether(
+            name='fooddescription',
+            index_together=set([('food_group', 'energy_kcal')]),
+        ),
+    ]
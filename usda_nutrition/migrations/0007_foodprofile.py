@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 17:13
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('usda_nutrition', '0006_food_derived_values'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FoodProfile',
+            fields=[
+                ('food_description', models.OneToOneField(help_text='The food this profile serializes.', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='profile', serialize=False, to='usda_nutrition.FoodDescription')),
+                ('data', models.BinaryField(help_text='The food, its food group, weights, footnotes and nutrient values as compact UTF-8 JSON. Written by import_usda; see usda_nutrition.profiles.')),
+            ],
+        ),
+    ]
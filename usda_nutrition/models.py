@@ -6,18 +6,45 @@ USDA documentation. For more information, view the PDF (data/sr28/sr28_doc.pdf).
 
 Several of the tables corresponding to data sources are included at the end of
 this module, but commented out.
+
+NutrientData is imported from NUT_DATA.txt, which is too large to ship with
+this package; see the README for how to import it.
 """
-from django.db import models
+from django.db import connections, models
+
+from .cache import CachedLookup
 
 
 class FoodGroup(models.Model):
     code = models.CharField(max_length=4, primary_key=True, help_text='4-digit code identifying a food group. Only the first 2 digits are currently assigned. In the future, the last 2 digits may be used. Codes may not be consecutive.')
     description = models.CharField(max_length=60, help_text='Name of food group.')
 
+    objects = models.Manager()
+    cached = CachedLookup()
+
     def __str__(self):
         return self.description
 
 
+class FoodQuerySet(models.QuerySet):
+    def in_bulk(self, id_list=None):
+        """
+        Like `QuerySet.in_bulk()`, but looking up long lists of ids in batches,
+        within the database's limit on query parameters (999 on SQLite before
+        3.32).
+        """
+        if id_list is None:
+            return super(FoodQuerySet, self).in_bulk()
+        id_list = list(id_list)
+        if not id_list:
+            return {}
+        batch_size = connections[self.db].ops.bulk_batch_size(['pk'], id_list) or len(id_list)
+        objects = {}
+        for start in range(0, len(id_list), batch_size):
+            objects.update(super(FoodQuerySet, self).in_bulk(id_list[start:start + batch_size]))
+        return objects
+
+
 class FoodDescription(models.Model):
     ndb_no = models.CharField(max_length=5, primary_key=True, help_text='5-digit Nutrient Databank number that uniquely identifies a food item. If this field is defined as numeric, the leading zero will be lost.')
     food_group = models.ForeignKey(FoodGroup, help_text='4-digit code indicating food group to which a food item belongs.')
@@ -34,6 +61,18 @@ class FoodDescription(models.Model):
     fat_factor = models.DecimalField(max_digits=6, decimal_places=2, null=True, blank=True, help_text='Factor for calculating calories from fat (see p. 14).')
     cho_factor = models.DecimalField(max_digits=6, decimal_places=2, null=True, blank=True, help_text='Factor for calculating calories from carbohydrate (see p. 14).')
 
+    # Derived from the fields above and related data by import_usda.
+    energy_kcal = models.DecimalField(max_digits=7, decimal_places=2, null=True, blank=True, db_index=True, help_text='Energy in kcal per 100 grams, edible portion, calculated from the protein, fat and carbohydrate factors (or the reported energy value, for foods without factors).')
+    edible_fraction = models.DecimalField(max_digits=4, decimal_places=3, null=True, blank=True, help_text='Fraction of the food as purchased that is edible, from the percentage of refuse.')
+    serving_grams = models.DecimalField(max_digits=8, decimal_places=1, null=True, blank=True, help_text='Gram weight of the first household measure (Weight sequence 1).')
+
+    objects = FoodQuerySet.as_manager()
+
+    class Meta:
+        index_together = [
+            ('food_group', 'energy_kcal'),
+        ]
+
     def __str__(self):
         return self.short_desc
 
@@ -46,6 +85,9 @@ class NutrientDefinition(models.Model):
     num_decimal_places = models.CharField(max_length=1, help_text='Number of decimal places to which a nutrient value is rounded.')
     sort_order = models.PositiveSmallIntegerField(help_text='Used to sort nutrient records in the same order as various reports produced from SR.')
 
+    objects = models.Manager()
+    cached = CachedLookup()
+
     def __str__(self):
         return self.nutrient_description
 
@@ -72,6 +114,9 @@ class SourceCode(models.Model):
     source_code = models.CharField(primary_key=True, max_length=2, help_text='A 2-digit code indicating type of data.')
     description = models.CharField(max_length=60, help_text='Description of source code that identifies the type of nutrient data.')
 
+    objects = models.Manager()
+    cached = CachedLookup()
+
     def __str__(self):
         return '%s: %s' % (self.source_code, self.description)
 
@@ -80,6 +125,9 @@ class DerivationCode(models.Model):
     code = models.CharField(max_length=4, primary_key=True, help_text='Derivation Code.')
     description = models.CharField(max_length=120, help_text='Description of derivation code giving specific information on how the value was determined.')
 
+    objects = models.Manager()
+    cached = CachedLookup()
+
     def __str__(self):
         return self.code
 
@@ -97,25 +145,53 @@ class Weight(models.Model):
         return '%s %s %s' % (self.amount, self.measure_description, self.food_description)
 
 
-# class NutrientData(models.Model):
-#     food_description = models.ForeignKey(FoodDescription, related_name='nutrient_data', help_text='5-digit Nutrient Databank number that uniquely identifies a food item. If this field is defined as numeric, the leading zero will be lost.')
-#     nutrient_definition = models.ForeignKey(NutrientDefinition, help_text='Unique 3-digit identifier code for a nutrient.')
-#     nutrient_value = models.DecimalField(max_digits=13, decimal_places=3, help_text='Amount in 100 grams, edible portion. (Nutrient values have been rounded to a specified number of decimal places for each nutrient. Number of decimal places is listed in the Nutrient Definition file.)')
-#     number_data_points = models.PositiveSmallIntegerField(help_text='Number of data points is the number of analyses used to calculate the nutrient value. If the number of data points is 0, the value was calculated or imputed.')
-#     standard_error = models.DecimalField(max_digits=11, decimal_places=3, blank=True, null=True, help_text='Standard error of the mean. Null if cannot be calculated. The standard error is also not given if the number of data points is less than three.')
-#     source_code = models.ForeignKey(SourceCode, help_text='Code indicating type of data.')
-#     derivation_code = models.ForeignKey(DerivationCode, blank=True, null=True, help_text='Data Derivation Code giving specific information on how the value is determined. This field is populated only for items added or updated starting with SR14. This field may not be populated if older records were used in the calculation of the mean value.')
-#     ref_food_description = models.ForeignKey(FoodDescription, blank=True, null=True, help_text='NDB number of the item used to calculate a missing value. Populated only for items added or updated starting with SR14.')
-#     add_nutr_mark = models.NullBooleanField(help_text='Indicates a vitamin or mineral added for fortification or enrichment. This field is populated for ready-to- eat breakfast cereals and many brand-name hot cereals in food group 08.')
-#     num_studies = models.PositiveSmallIntegerField(null=True, blank=True, help_text='Number of studies.')
-#     minimum = models.DecimalField(max_digits=13, decimal_places=3, help_text='Minimum value.')
-#     maximum = models.DecimalField(max_digits=13, decimal_places=3, help_text='Maximum value.')
-#     degrees_of_freedom = models.PositiveSmallIntegerField(null=True, blank=True, help_text='Degrees of freedom.')
-#     lower_error_bound = models.DecimalField(max_digits=13, decimal_places=3, help_text='Lower 95% error bound.')
-#     upper_error_bound = models.DecimalField(max_digits=13, decimal_places=3, help_text='Upper 95% error bound.')
-#     statistical_comments = models.CharField(max_length=10, null=True, blank=True, help_text='Statistical comments. See definitions below.')
-#     modified_date = models.CharField(max_length=10, null=True, blank=True, help_text='Indicates when a value was either added to the database or last modified.')
-#     confidence_code = models.CharField(max_length=1, null=True, blank=True, help_text='Confidence Code indicating data quality, based on evaluation of sample plan, sample handling, analytical method, analytical quality control, and number of samples analyzed. Not included in this release, but is planned for future releases.')
+class NutrientData(models.Model):
+    food_description = models.ForeignKey(FoodDescription, related_name='nutrient_data', db_index=False, help_text='5-digit Nutrient Databank number that uniquely identifies a food item. If this field is defined as numeric, the leading zero will be lost.')
+    nutrient_definition = models.ForeignKey(NutrientDefinition, related_name='nutrient_data', db_index=False, help_text='Unique 3-digit identifier code for a nutrient.')
+    nutrient_value = models.DecimalField(max_digits=13, decimal_places=3, help_text='Amount in 100 grams, edible portion. (Nutrient values have been rounded to a specified number of decimal places for each nutrient. Number of decimal places is listed in the Nutrient Definition file.)')
+    number_data_points = models.PositiveIntegerField(help_text='Number of data points is the number of analyses used to calculate the nutrient value. If the number of data points is 0, the value was calculated or imputed.')
+    standard_error = models.DecimalField(max_digits=11, decimal_places=3, blank=True, null=True, help_text='Standard error of the mean. Null if cannot be calculated. The standard error is also not given if the number of data points is less than three.')
+    source_code = models.ForeignKey(SourceCode, help_text='Code indicating type of data.')
+    derivation_code = models.ForeignKey(DerivationCode, blank=True, null=True, help_text='Data Derivation Code giving specific information on how the value is determined. This field is populated only for items added or updated starting with SR14. This field may not be populated if older records were used in the calculation of the mean value.')
+    ref_food_description = models.ForeignKey(FoodDescription, related_name='referenced_nutrient_data', blank=True, null=True, help_text='NDB number of the item used to calculate a missing value. Populated only for items added or updated starting with SR14.')
+    add_nutr_mark = models.NullBooleanField(help_text='Indicates a vitamin or mineral added for fortification or enrichment. This field is populated for ready-to- eat breakfast cereals and many brand-name hot cereals in food group 08.')
+    num_studies = models.PositiveSmallIntegerField(null=True, blank=True, help_text='Number of studies.')
+    minimum = models.DecimalField(max_digits=13, decimal_places=3, null=True, blank=True, help_text='Minimum value.')
+    maximum = models.DecimalField(max_digits=13, decimal_places=3, null=True, blank=True, help_text='Maximum value.')
+    degrees_of_freedom = models.PositiveSmallIntegerField(null=True, blank=True, help_text='Degrees of freedom.')
+    lower_error_bound = models.DecimalField(max_digits=13, decimal_places=3, null=True, blank=True, help_text='Lower 95% error bound.')
+    upper_error_bound = models.DecimalField(max_digits=13, decimal_places=3, null=True, blank=True, help_text='Upper 95% error bound.')
+    statistical_comments = models.CharField(max_length=10, null=True, blank=True, help_text='Statistical comments. See definitions below.')
+    modified_date = models.CharField(max_length=10, null=True, blank=True, help_text='Indicates when a value was either added to the database or last modified.')
+    confidence_code = models.CharField(max_length=1, null=True, blank=True, help_text='Confidence Code indicating data quality, based on evaluation of sample plan, sample handling, analytical method, analytical quality control, and number of samples analyzed. Not included in this release, but is planned for future releases.')
+
+    class Meta:
+        # The composite unique index serves per-food lookups and the composite
+        # index serves per-nutrient lookups and ranges, so the single-column
+        # indexes Django would add for the two ForeignKeys are left out; at
+        # ~680k rows they only slow down bulk loading.
+        unique_together = ('food_description', 'nutrient_definition')
+        index_together = ('nutrient_definition', 'nutrient_value')
+        verbose_name_plural = 'nutrient data'
+
+    def __str__(self):
+        return '%s %s: %s' % (self.food_description_id, self.nutrient_definition_id, self.nutrient_value)
+
+
+class FoodProfile(models.Model):
+    food_description = models.OneToOneField(FoodDescription, primary_key=True, related_name='profile', help_text='The food this profile serializes.')
+    data = models.BinaryField(help_text='The food, its food group, weights, footnotes and nutrient values as compact UTF-8 JSON. Written by import_usda; see usda_nutrition.profiles.')
+
+    def __str__(self):
+        return 'Profile of %s' % self.food_description_id
+
+
+class DataVersion(models.Model):
+    version = models.PositiveIntegerField(default=0, help_text='Incremented by each run of import_usda, so that long-running processes can tell their cached data is out of date.')
+    imported_at = models.DateTimeField(null=True, blank=True, help_text='When import_usda last completed.')
+
+    def __str__(self):
+        return 'Version %d' % self.version
 
 
 # class DataSource(models.Model):
@@ -0,0 +1,173 @@
+"""
+Conversion of household measures ("2 tbsp", "1 pat", "3 oz") to grams, from
+an in-memory index of `Weight`:
+
+    from usda_nutrition.portions import to_grams
+
+    to_grams([('01001', 2, 'tbsp'), ('01001', 1, 'pat'), ('09003', 1, 'cup, sliced')])
+
+`to_grams()` uses a process-wide index that is built from a single query on
+first use, and rebuilt after `import_usda` runs. Conversions that can't be
+made return None.
+
+Units are normalized before they are looked up: case, plurals, punctuation and
+parenthesized details are ignored, and common spellings are mapped to SR's
+abbreviations ("tablespoons" and "Tbsp." are both "tbsp"). A unit matches a
+food's measure either by its full description ("cup, chopped") or by its first
+word ("cup"). Weights (g, oz, lb...) never need the food's measures; other
+volumes (tsp, fl oz, ml...) are converted through any volume measure the food
+has.
+"""
+import re
+from functools import lru_cache
+
+from . import models
+from .cache import versioned
+
+
+UNIT_ALIASES = {
+    'tablespoon': 'tbsp', 'tbs': 'tbsp', 'tbl': 'tbsp', 'tb': 'tbsp',
+    'teaspoon': 'tsp', 'ts': 'tsp',
+    'c': 'cup',
+    'ounce': 'oz',
+    'fluid ounce': 'fl oz', 'fl ounce': 'fl oz', 'floz': 'fl oz',
+    'pound': 'lb', 'lbs': 'lb',
+    'gram': 'g', 'gm': 'g', 'gr': 'g', 'grams': 'g',
+    'kilogram': 'kg', 'kilo': 'kg',
+    'milligram': 'mg',
+    'milliliter': 'ml', 'millilitre': 'ml',
+    'liter': 'l', 'litre': 'l',
+    'pint': 'pt',
+    'quart': 'qt',
+    'gallon': 'gal',
+}
+
+# Grams per unit.
+MASS_UNITS = {
+    'g': 1.0,
+    'mg': 0.001,
+    'kg': 1000.0,
+    'oz': 28.349523125,
+    'lb': 453.59237,
+}
+
+# Teaspoons per unit.
+VOLUME_UNITS = {
+    'tsp': 1.0,
+    'tbsp': 3.0,
+    'fl oz': 6.0,
+    'cup': 48.0,
+    'pt': 96.0,
+    'qt': 192.0,
+    'gal': 768.0,
+    'ml': 0.20288413535,
+    'l': 202.88413535,
+}
+
+PARENTHESES_RE = re.compile(r'\([^)]*\)?')
+WORD_RE = re.compile(r'[a-z0-9/]+')
+
+
+def singular(word):
+    if word in UNIT_ALIASES or len(word) <= 3 or not word.endswith('s') or word.endswith('ss'):
+        return word
+    return word[:-1]
+
+
+def canonical(words):
+    """
+    Return the canonical unit for the first one or two of `words`, and the
+    number of words it used.
+    """
+    if len(words) > 1:
+        pair = '%s %s' % (words[0], words[1])
+        if pair in UNIT_ALIASES or pair in VOLUME_UNITS:
+            return UNIT_ALIASES.get(pair, pair), 2
+    if words:
+        return UNIT_ALIASES.get(words[0], words[0]), 1
+    return '', 0
+
+
+@lru_cache(maxsize=4096)
+def normalize(unit):
+    """
+    Return `(description, unit)` keys for a unit or measure description:
+
+    >>> normalize('Pat (1" sq, 1/3" high)')
+    ('pat', 'pat')
+    >>> normalize('Cups, chopped')
+    ('cup chopped', 'cup')
+    """
+    text = PARENTHESES_RE.sub(' ', unit.lower().replace('.', ''))
+    words = [singular(word) for word in WORD_RE.findall(text)]
+    head, used = canonical(words)
+    return ' '.join([head] + words[used:]), head
+
+
+class PortionIndex(object):
+    def __init__(self, weights):
+        """
+        Build the index from `(ndb_no, amount, measure_description,
+        gram_weight)` tuples. Where several measures normalize to the same
+        key, the first one wins, so pass them in sequence order.
+        """
+        self.measures = {}
+        # Grams per teaspoon, from the first volume measure of each food.
+        self.densities = {}
+        for ndb_no, amount, description, gram_weight in weights:
+            if not amount:
+                continue
+            grams = float(gram_weight) / float(amount)
+            measures = self.measures.setdefault(ndb_no, {})
+            for key in normalize(description):
+                measures.setdefault(key, grams)
+            unit = normalize(description)[1]
+            if unit in VOLUME_UNITS and ndb_no not in self.densities:
+                self.densities[ndb_no] = grams / VOLUME_UNITS[unit]
+
+    @classmethod
+    def from_database(cls):
+        return cls(models.Weight.objects.order_by('food_description_id', 'sequence').values_list(
+            'food_description_id', 'amount', 'measure_description', 'gram_weight').iterator())
+
+    def grams(self, ndb_no, quantity, unit):
+        """
+        Return the grams in `quantity` `unit`s of a food, or None if the unit
+        can't be converted for that food. `quantity` may be any real number,
+        such as a Decimal from a model field.
+        """
+        quantity = float(quantity)
+        description, head = normalize(unit)
+        if head in MASS_UNITS and description == head:
+            return quantity * MASS_UNITS[head]
+        measures = self.measures.get(ndb_no)
+        if measures:
+            grams = measures.get(description) or measures.get(head)
+            if grams is not None:
+                return quantity * grams
+        if head in VOLUME_UNITS and ndb_no in self.densities:
+            return quantity * VOLUME_UNITS[head] * self.densities[ndb_no]
+        return None
+
+    def to_grams(self, items):
+        """
+        Convert an iterable of `(ndb_no, quantity, unit)` to a list of grams
+        (or None for the items that can't be converted).
+        """
+        grams = self.grams
+        return [grams(ndb_no, quantity, unit) for ndb_no, quantity, unit in items]
+
+
+@versioned
+def get_portion_index():
+    """
+    Return the process-wide index.
+    """
+    return PortionIndex.from_database()
+
+
+clear_portion_index = get_portion_index.clear
+
+
+def to_grams(items):
+    return get_portion_index().to_grams(items)
@@ -0,0 +1,196 @@
+"""
+Pre-serialized food profiles, for API endpoints that return whole foods:
+
+    from usda_nutrition.profiles import get_profile
+
+    def food_detail(request, ndb_no):
+        data = get_profile(ndb_no)
+        if data is None:
+            raise Http404
+        return HttpResponse(data, content_type='application/json')
+
+A profile is a food with its food group, weights, footnotes and nutrient
+values, as compact UTF-8 JSON. `import_usda` writes one per food to
+`FoodProfile`, so serving one never touches the other tables.
+
+Profiles are read through the Django cache named by the
+`USDA_NUTRITION_PROFILE_CACHE` setting (default: "default"), under keys that
+include the `DataVersion` stamp. A re-import changes the stamp, so every
+process moves on to new keys once it sees it (see `usda_nutrition.cache`) and
+the old entries expire or are evicted. Entries are kept for
+`USDA_NUTRITION_PROFILE_TIMEOUT` seconds (default: `None`, as long as the
+cache allows). A cached profile costs one cache lookup.
+"""
+import itertools
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import models
+from .cache import data_version
+
+
+DEFAULT_CACHE = 'default'
+KEY_PREFIX = 'usda_nutrition:profile'
+BATCH_SIZE = 500
+
+FOOD_FIELDS = (
+    'ndb_no', 'long_desc', 'short_desc', 'com_name', 'manufacturer_name', 'survey', 'refuse_description',
+    'refuse', 'scientific_name', 'energy_kcal', 'edible_fraction', 'serving_grams',
+)
+FOOD_GROUP_FIELDS = ('code', 'description')
+WEIGHT_FIELDS = ('sequence', 'amount', 'measure_description', 'gram_weight')
+FOOTNOTE_FIELDS = ('footnote_no', 'footnote_type', 'nutrient_definition_id', 'footnote_text')
+NUTRIENT_FIELDS = (
+    'nutrient_definition_id', 'nutrient_definition__tagname', 'nutrient_definition__nutrient_description',
+    'nutrient_definition__units', 'nutrient_value',
+)
+
+# Keys of the serialized rows, by position in the fields above.
+FOOTNOTE_KEYS = ('footnote_no', 'footnote_type', 'nutrient_number', 'footnote_text')
+NUTRIENT_KEYS = ('nutrient_number', 'tagname', 'description', 'units', 'value')
+
+
+def default(value):
+    # Decimals become JSON numbers; SR values fit comfortably in a float.
+    return float(value)
+
+
+def dumps(profile):
+    return json.dumps(profile, separators=(',', ':'), ensure_ascii=False, default=default).encode('utf-8')
+
+
+def grouped(queryset, fields):
+    """
+    Yield `(ndb_no, rows)` for the rows of a `food_description` child table,
+    in ndb_no order.
+    """
+    rows = queryset.values_list('food_description_id', *fields).iterator()
+    for ndb_no, group in itertools.groupby(rows, key=lambda row: row[0]):
+        yield ndb_no, [row[1:] for row in group]
+
+
+def merged(foods, children):
+    """
+    Return the rows of a grouped child table for each of `foods` (ndb_nos in
+    order), consuming `children` as it goes.
+    """
+    pending = next(children, None)
+    for ndb_no in foods:
+        while pending is not None and pending[0] < ndb_no:
+            pending = next(children, None)
+        if pending is not None and pending[0] == ndb_no:
+            yield pending[1]
+            pending = next(children, None)
+        else:
+            yield []
+
+
+def serialize_foods():
+    """
+    Yield `(ndb_no, profile bytes)` for every food, streaming the tables in
+    ndb_no order rather than loading them whole.
+    """
+    food_groups = {
+        code: dict(zip(FOOD_GROUP_FIELDS, (code, description)))
+        for code, description in models.FoodGroup.objects.values_list(*FOOD_GROUP_FIELDS)
+    }
+    foods = list(models.FoodDescription.objects.order_by('ndb_no').values_list('food_group_id', *FOOD_FIELDS))
+    ndb_nos = [food[1] for food in foods]
+    weights = merged(ndb_nos, grouped(
+        models.Weight.objects.order_by('food_description_id', 'sequence'), WEIGHT_FIELDS))
+    footnotes = merged(ndb_nos, grouped(
+        models.Footnote.objects.order_by('food_description_id', 'pk'), FOOTNOTE_FIELDS))
+    nutrients = merged(ndb_nos, grouped(
+        models.NutrientData.objects.order_by('food_description_id', 'nutrient_definition__sort_order'),
+        NUTRIENT_FIELDS))
+
+    for food, food_weights, food_footnotes, food_nutrients in zip(foods, weights, footnotes, nutrients):
+        profile = dict(zip(FOOD_FIELDS, food[1:]))
+        profile['food_group'] = food_groups[food[0]]
+        profile['weights'] = [dict(zip(WEIGHT_FIELDS, row)) for row in food_weights]
+        profile['footnotes'] = [dict(zip(FOOTNOTE_KEYS, row)) for row in food_footnotes]
+        profile['nutrients'] = [dict(zip(NUTRIENT_KEYS, row)) for row in food_nutrients]
+        yield profile['ndb_no'], dumps(profile)
+
+
+def build_profiles():
+    """
+    Bring every `FoodProfile` in line with the current tables, writing only
+    the profiles that have changed, and return how many were written or
+    deleted.
+    """
+    stored = {
+        ndb_no: hash(bytes(data))
+        for ndb_no, data in models.FoodProfile.objects.values_list('pk', 'data').iterator()
+    }
+    changed = (
+        (ndb_no, data) for ndb_no, data in serialize_foods()
+        if stored.pop(ndb_no, None) != hash(data)
+    )
+    count = 0
+    while True:
+        batch = [
+            models.FoodProfile(food_description_id=ndb_no, data=data)
+            for ndb_no, data in itertools.islice(changed, BATCH_SIZE)
+        ]
+        if not batch:
+            break
+        models.FoodProfile.objects.filter(pk__in=[profile.pk for profile in batch]).delete()
+        models.FoodProfile.objects.bulk_create(batch)
+        count += len(batch)
+    # Whatever is left belongs to foods that no longer exist.
+    removed = list(stored)
+    for start in range(0, len(removed), BATCH_SIZE):
+        models.FoodProfile.objects.filter(pk__in=removed[start:start + BATCH_SIZE]).delete()
+    return count + len(removed)
+
+
+def get_cache():
+    return caches[getattr(settings, 'USDA_NUTRITION_PROFILE_CACHE', DEFAULT_CACHE)]
+
+
+def profile_key(ndb_no, version):
+    return '%s:%d:%s' % (KEY_PREFIX, version, ndb_no)
+
+
+def load_profiles(ndb_nos, version, cache):
+    """
+    Read profiles from `FoodProfile` and store them in the cache.
+    """
+    profiles = {
+        ndb_no: bytes(data)
+        for ndb_no, data in models.FoodProfile.objects.filter(pk__in=ndb_nos).values_list('pk', 'data')
+    }
+    cache.set_many(
+        {profile_key(ndb_no, version): data for ndb_no, data in profiles.items()},
+        getattr(settings, 'USDA_NUTRITION_PROFILE_TIMEOUT', None))
+    return profiles
+
+
+def get_profiles(ndb_nos):
+    """
+    Return a dict of ndb_no to profile bytes for those of `ndb_nos` that
+    have a profile.
+    """
+    cache = get_cache()
+    version = data_version()
+    keys = {profile_key(ndb_no, version): ndb_no for ndb_no in ndb_nos}
+    profiles = {keys[key]: data for key, data in cache.get_many(list(keys)).items()}
+    missing = [ndb_no for ndb_no in keys.values() if ndb_no not in profiles]
+    if missing:
+        profiles.update(load_profiles(missing, version, cache))
+    return profiles
+
+
+def get_profile(ndb_no):
+    """
+    Return the profile of a food as JSON bytes, or None if it has none.
+    """
+    cache = get_cache()
+    version = data_version()
+    data = cache.get(profile_key(ndb_no, version))
+    if data is None:
+        data = load_profiles([ndb_no], version, cache).get(ndb_no)
+    return data
@@ -0,0 +1,292 @@
+"""
+Full-text search over food descriptions.
+
+    from usda_nutrition.search import search_foods
+
+    search_foods('cheddar cheese', limit=10, food_group='0100')
+
+Descriptions and queries go through the same tokenizer, which expands the
+abbreviations SR uses in `short_desc` (see Appendix A of the SR
+documentation), so that "w/ salt" and "with salt" are the same query. Every
+query term must match; the last one may also match as a prefix, ranked below
+exact matches, so that results can be shown as the user types.
+
+The index is built by `import_usda`, or with `build_index()`. The backend is
+picked by the `USDA_NUTRITION_SEARCH_BACKEND` setting:
+
+- 'postgresql': a tsvector column with a GIN index, ranked with `ts_rank`.
+  This is the default on PostgreSQL.
+- 'python': an in-memory inverted index with precomputed BM25 scores, built
+  once per process from `FoodDescription`, and rebuilt after an import. This
+  is the default on other databases.
+- 'sqlite': an FTS5 table, ranked with `bm25()`. It avoids holding the index
+  in every process, but ranking terms that match thousands of foods (such as
+  "raw" or "cooked") takes several milliseconds.
+"""
+import bisect
+import collections
+import heapq
+import math
+import re
+
+from django.conf import settings
+from django.db import connection
+
+from . import models
+from .cache import versioned
+
+
+SEARCH_TABLE = 'usda_nutrition_foodsearch'
+
+# Abbreviations used in SR short descriptions.
+ABBREVIATIONS = {
+    'w/': 'with', 'wo/': 'without', '&': 'and',
+    'appl': 'applesauce', 'aus': 'australian', 'bev': 'beverage', 'bf': 'beef', 'bkd': 'baked',
+    'bld': 'boiled', 'bnless': 'boneless', 'bnls': 'boneless', 'bns': 'beans', 'brkfst': 'breakfast',
+    'brld': 'broiled', 'brsd': 'braised', 'btld': 'bottled', 'bttm': 'bottom', 'cal': 'calorie',
+    'chick': 'chicken', 'choc': 'chocolate', 'choic': 'choice', 'chs': 'cheese', 'cinn': 'cinnamon',
+    'cnd': 'canned', 'cntr': 'center', 'cocnt': 'coconut', 'commly': 'commercially', 'conc': 'concentrate',
+    'cond': 'condensed', 'ckd': 'cooked', 'crl': 'cereal', 'crm': 'cream', 'dk': 'dark', 'dom': 'domestic',
+    'drk': 'dark', 'drnd': 'drained', 'drsng': 'dressing', 'drumstk': 'drumstick', 'dssrt': 'dessert',
+    'enr': 'enriched', 'fd': 'food', 'flav': 'flavored', 'flr': 'flour', 'fort': 'fortified',
+    'frsh': 'fresh', 'frstd': 'frosted', 'frz': 'frozen', 'grds': 'grades', 'grld': 'grilled',
+    'grn': 'green', 'htd': 'heated', 'hvy': 'heavy', 'hydr': 'hydrogenated', 'immat': 'immature',
+    'imp': 'imported', 'incl': 'including', 'inf': 'infant', 'inst': 'instant', 'juc': 'juice',
+    'krnls': 'kernels', 'liq': 'liquid', 'ln': 'lean', 'lo': 'low', 'lofat': 'lowfat', 'lrg': 'large',
+    'lt': 'light', 'med': 'medium', 'mxd': 'mixed', 'na': 'sodium', 'nat': 'natural', 'nz': 'new zealand',
+    'past': 'pasteurized', 'pdr': 'powder', 'pk': 'pack', 'pln': 'plain', 'pnut': 'peanut',
+    'prep': 'prepared', 'prot': 'protein', 'refr': 'refrigerated', 'reg': 'regular', 'rnd': 'round',
+    'rst': 'roast', 'rstd': 'roasted', 'rte': 'ready to eat', 'rtf': 'ready to feed',
+    'rts': 'ready to serve', 'sau': 'sauce', 'sel': 'select', 'shldr': 'shoulder', 'shrt': 'short',
+    'simmrd': 'simmered', 'skn': 'skin', 'sml': 'small', 'sndwch': 'sandwich', 'sol': 'solids',
+    'soln': 'solution', 'spl': 'special', 'sprd': 'spread', 'stk': 'steak', 'str': 'strained',
+    'stwd': 'stewed', 'swt': 'sweet', 'swtnd': 'sweetened', 'tstd': 'toasted', 'unenr': 'unenriched',
+    'unhtd': 'unheated', 'unprep': 'unprepared', 'unswtnd': 'unsweetened', 'var': 'variety',
+    'veg': 'vegetable', 'vit': 'vitamin', 'whl': 'whole', 'yel': 'yellow',
+}
+STOPWORDS = {'a', 'and', 'in', 'of', 'or', 'the'}
+TOKEN_RE = re.compile(r"wo/|w/|&|[^\W_]+")
+
+# Relative weight of each field; the backends apply them in their own way.
+FIELD_WEIGHTS = (('long_desc', 1.0), ('short_desc', 0.5), ('com_name', 1.0))
+
+
+def normalize(word):
+    """
+    Reduce simple English plurals, so that "apples" matches "apple".
+    """
+    if len(word) <= 3 or not word.isalpha():
+        return word
+    if word.endswith('ies'):
+        return word[:-3] + 'y'
+    if word.endswith('oes'):
+        return word[:-2]
+    if word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    return word
+
+
+def tokenize(text):
+    tokens = []
+    for word in TOKEN_RE.findall((text or '').lower().replace("'", '')):
+        for token in ABBREVIATIONS.get(word, word).split():
+            if token not in STOPWORDS:
+                tokens.append(normalize(token))
+    return tokens
+
+
+def documents():
+    """
+    Yield `(ndb_no, food_group_id, fields)` for every food, where `fields`
+    holds the normalized text of each of `FIELD_WEIGHTS`.
+    """
+    rows = models.FoodDescription.objects.order_by('pk').values_list(
+        'ndb_no', 'food_group_id', *[field for field, weight in FIELD_WEIGHTS])
+    for row in rows.iterator():
+        yield row[0], row[1], [' '.join(tokenize(text)) for text in row[2:]]
+
+
+class PythonBackend(object):
+    k1 = 1.2
+    b = 0.75
+    prefix_weight = 0.5
+
+    def __init__(self):
+        self.ndb_nos = []
+        self.food_groups = []
+        postings = collections.defaultdict(dict)
+        lengths = []
+        for ndb_no, food_group_id, fields in documents():
+            doc = len(self.ndb_nos)
+            self.ndb_nos.append(ndb_no)
+            self.food_groups.append(food_group_id)
+            length = 0
+            for text, (_, weight) in zip(fields, FIELD_WEIGHTS):
+                for token in text.split():
+                    postings[token][doc] = postings[token].get(doc, 0) + weight
+                    length += weight
+            lengths.append(length)
+
+        # Precompute the BM25 score of each (term, document) pair.
+        average = sum(lengths) / len(lengths) if lengths else 0
+        self.scores = {}
+        for term, docs in postings.items():
+            idf = math.log(1 + (len(lengths) - len(docs) + 0.5) / (len(docs) + 0.5))
+            self.scores[term] = {
+                doc: idf * tf * (self.k1 + 1) / (tf + self.k1 * (1 - self.b + self.b * lengths[doc] / average))
+                for doc, tf in docs.items()
+            }
+        self.terms = sorted(self.scores)
+
+    def term_scores(self, token):
+        """
+        Return {document: score} for a query term, including prefix matches.
+        """
+        matches = dict(self.scores.get(token, {}))
+        start = bisect.bisect_left(self.terms, token)
+        for term in self.terms[start:]:
+            if not term.startswith(token):
+                break
+            if term != token:
+                for doc, score in self.scores[term].items():
+                    matches[doc] = max(matches.get(doc, 0), score * self.prefix_weight)
+        return matches
+
+    def search(self, tokens, limit, food_group=None):
+        per_term = [self.scores.get(token, {}) for token in tokens[:-1]]
+        per_term.append(self.term_scores(tokens[-1]))
+        per_term.sort(key=len)
+        totals = per_term[0]
+        if food_group is not None:
+            totals = {doc: score for doc, score in totals.items() if self.food_groups[doc] == food_group}
+        for scores in per_term[1:]:
+            totals = {doc: score + scores[doc] for doc, score in totals.items() if doc in scores}
+        ranked = heapq.nsmallest(limit, totals.items(), key=lambda item: (-item[1], item[0]))
+        return [(self.ndb_nos[doc], score) for doc, score in ranked]
+
+
+class SQLiteBackend(object):
+    def build(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM %s' % SEARCH_TABLE)
+            cursor.executemany(
+                'INSERT INTO %s (ndb_no, food_group_id, long_desc, short_desc, com_name) '
+                'VALUES (%%s, %%s, %%s, %%s, %%s)' % SEARCH_TABLE,
+                [(ndb_no, food_group_id) + tuple(fields) for ndb_no, food_group_id, fields in documents()])
+
+    def search(self, tokens, limit, food_group=None):
+        match = ' AND '.join(['"%s"' % token for token in tokens[:-1]] + ['("%s" OR "%s"*)' % (tokens[-1], tokens[-1])])
+        weights = ', '.join(str(weight) for field, weight in FIELD_WEIGHTS)
+        sql = 'SELECT ndb_no, -bm25(%s, 0, 0, %s) FROM %s WHERE %s MATCH %%s' % (
+            SEARCH_TABLE, weights, SEARCH_TABLE, SEARCH_TABLE)
+        params = [match]
+        if food_group is not None:
+            sql += ' AND food_group_id = %s'
+            params.append(food_group)
+        sql += ' ORDER BY 2 DESC, ndb_no LIMIT %s'
+        params.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+
+class PostgreSQLBackend(object):
+    # Field weights map onto tsvector weight classes.
+    weight_classes = {1.0: 'A', 0.5: 'B'}
+
+    def build(self):
+        document = ' || '.join(
+            "setweight(to_tsvector('simple', %%s), '%s')" % self.weight_classes[weight]
+            for field, weight in FIELD_WEIGHTS)
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM %s' % SEARCH_TABLE)
+            cursor.executemany(
+                'INSERT INTO %s (ndb_no, food_group_id, document) VALUES (%%s, %%s, %s)' % (
+                    SEARCH_TABLE, document),
+                [(ndb_no, food_group_id) + tuple(fields) for ndb_no, food_group_id, fields in documents()])
+
+    def search(self, tokens, limit, food_group=None):
+        query = ' & '.join(tokens[:-1] + ['(%s | %s:*)' % (tokens[-1], tokens[-1])])
+        sql = (
+            "SELECT ndb_no, ts_rank(document, query) FROM %s, to_tsquery('simple', %%s) query "
+            "WHERE document @@ query" % SEARCH_TABLE)
+        params = [query]
+        if food_group is not None:
+            sql += ' AND food_group_id = %s'
+            params.append(food_group)
+        sql += ' ORDER BY 2 DESC, ndb_no LIMIT %s'
+        params.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+
+BACKENDS = {
+    'python': PythonBackend,
+    'sqlite': SQLiteBackend,
+    'postgresql': PostgreSQLBackend,
+}
+
+
+def backend_name():
+    name = getattr(settings, 'USDA_NUTRITION_SEARCH_BACKEND', None)
+    if name:
+        return name
+    return 'postgresql' if connection.vendor == 'postgresql' else 'python'
+
+
+def search_table_exists():
+    return SEARCH_TABLE in connection.introspection.table_names()
+
+
+@versioned
+def get_python_backend():
+    return PythonBackend()
+
+
+def get_backend():
+    name = backend_name()
+    if name != 'python':
+        return BACKENDS[name]()
+    return get_python_backend()
+
+
+def build_index():
+    """
+    (Re)build the search table from `FoodDescription`, if the database has
+    one. The in-memory index is rebuilt lazily, on the next search.
+    """
+    get_python_backend.clear()
+    if connection.vendor in BACKENDS and search_table_exists():
+        BACKENDS[connection.vendor]().build()
+
+
+def rank_foods(query, limit=20, food_group=None):
+    """
+    Like `search_foods()`, but return `(ndb_no, rank)` pairs without
+    fetching the foods.
+    """
+    tokens = list(collections.OrderedDict.fromkeys(tokenize(query)))
+    if not tokens:
+        return []
+    if food_group is not None:
+        food_group = getattr(food_group, 'pk', food_group)
+    return get_backend().search(tokens, limit, food_group)
+
+
+def search_foods(query, limit=20, food_group=None):
+    """
+    Return up to `limit` foods matching `query`, best matches first. Each
+    food has a `search_rank` attribute; higher is better. `food_group` may be
+    a `FoodGroup` or its code.
+    """
+    ranked = rank_foods(query, limit, food_group)
+    if not ranked:
+        return []
+    foods = models.FoodDescription.objects.in_bulk([ndb_no for ndb_no, rank in ranked])
+    results = []
+    for ndb_no, rank in ranked:
+        food = foods[ndb_no]
+        food.search_rank = rank
+        results.append(food)
+    return results
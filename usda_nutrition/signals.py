@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+
+# Sent by `import_usda` once an import (or sync) has completed.
+data_imported = Signal(providing_args=['version'])
@@ -0,0 +1,154 @@
+"""
+Nearest-neighbour search over nutrient profiles, to suggest substitutes for a
+food:
+
+    from usda_nutrition.similarity import similar_foods
+
+    similar_foods('01001', k=5, food_group='0400')
+
+Each food is a vector of its nutrient values, either per 100 g (the default)
+or per 100 kcal (`basis='kcal'`, which leaves out foods without energy). Each
+nutrient is scaled by its standard deviation across foods, so that nutrients
+measured in grams don't drown out those measured in micrograms, and foods are
+ranked by Euclidean distance. `nutrients` restricts the comparison to some
+nutrient numbers.
+
+The search is an exact, vectorized scan of every food; at SR28's size it takes
+about a millisecond, so no approximate index is needed.
+
+Requires NumPy. The index is built once per process from the nutrient matrix
+(see `usda_nutrition.matrix`), and rebuilt with it after an import. If the
+`USDA_NUTRITION_SIMILARITY_PATH` setting is set, `import_usda` saves the index
+there and other processes load it instead of reading the nutrient values from
+the database.
+"""
+import os
+
+import numpy as np
+from django.conf import settings
+
+from . import models
+from .cache import versioned
+from .matrix import get_matrix
+
+
+ENERGY_KCAL = '208'
+BASES = ('100g', 'kcal')
+
+
+class SimilarityIndex(object):
+    def __init__(self, ndb_nos, nutrient_numbers, food_groups, values):
+        self.ndb_nos = list(ndb_nos)
+        self.nutrient_numbers = list(nutrient_numbers)
+        self.food_groups = np.asarray(food_groups)
+        self.values = np.asarray(values, dtype=float)
+        self.food_index = {ndb_no: index for index, ndb_no in enumerate(self.ndb_nos)}
+        self.nutrient_index = {number: index for index, number in enumerate(self.nutrient_numbers)}
+        self.vectors = {basis: self.normalize(basis) for basis in BASES}
+        self.norms = {basis: np.einsum('ij,ij->i', vectors, vectors) for basis, vectors in self.vectors.items()}
+
+    @classmethod
+    def from_matrix(cls, matrix):
+        """
+        Build the index from a `NutrientMatrix`, counting the values SR
+        doesn't report as 0.
+        """
+        food_groups = dict(models.FoodDescription.objects.values_list('ndb_no', 'food_group_id'))
+        return cls(
+            matrix.ndb_nos, matrix.nutrient_numbers,
+            [food_groups[ndb_no] for ndb_no in matrix.ndb_nos], np.nan_to_num(matrix.values))
+
+    def save(self, path):
+        """
+        Write the index to `path` (an uncompressed NumPy `.npz` archive),
+        replacing any existing file atomically.
+        """
+        temporary = '%s.tmp' % path
+        with open(temporary, 'wb') as f:
+            np.savez(
+                f, ndb_nos=np.array(self.ndb_nos), nutrient_numbers=np.array(self.nutrient_numbers),
+                food_groups=self.food_groups, values=self.values)
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['ndb_nos'].tolist(), data['nutrient_numbers'].tolist(), data['food_groups'], data['values'])
+
+    def normalize(self, basis):
+        values = self.values
+        if basis == 'kcal':
+            energy = values[:, self.nutrient_index[ENERGY_KCAL]][:, None]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                values = np.where(energy > 0, values / energy * 100, np.nan)
+        elif basis != '100g':
+            raise ValueError('basis must be one of %s.' % ', '.join(BASES))
+        with np.errstate(invalid='ignore'):
+            scale = np.nanstd(values, axis=0)
+        scale[~(scale > 0)] = 1
+        return (values / scale).astype(np.float32)
+
+    def similar(self, ndb_no, k=10, nutrients=None, food_group=None, basis='100g'):
+        """
+        Return up to `k` `(ndb_no, distance)` pairs for the foods closest to
+        `ndb_no`, closest first.
+        """
+        if basis not in self.vectors:
+            raise ValueError('basis must be one of %s.' % ', '.join(BASES))
+        vectors, norms = self.vectors[basis], self.norms[basis]
+        if nutrients is not None:
+            vectors = vectors[:, [self.nutrient_index[number] for number in nutrients]]
+            norms = np.einsum('ij,ij->i', vectors, vectors)
+        row = self.food_index[ndb_no]
+        target = vectors[row]
+        if np.isnan(target).any():
+            raise ValueError('%s has no energy value to normalize by.' % ndb_no)
+
+        # |v - t|^2 = |v|^2 - 2 v.t + |t|^2, which is a single matrix-vector
+        # product given the precomputed norms.
+        squared = norms - 2 * (vectors @ target) + norms[row]
+        distances = np.sqrt(np.maximum(squared, 0))
+        distances[np.isnan(distances)] = np.inf
+        distances[row] = np.inf
+        if food_group is not None:
+            distances[self.food_groups != getattr(food_group, 'pk', food_group)] = np.inf
+
+        k = min(k, int(np.isfinite(distances).sum()))
+        if k <= 0:
+            return []
+        nearest = np.argpartition(distances, k - 1)[:k]
+        nearest = nearest[np.argsort(distances[nearest], kind='stable')]
+        return [(self.ndb_nos[index], float(distances[index])) for index in nearest]
+
+
+@versioned
+def get_similarity_index():
+    """
+    Return the process-wide index, from `USDA_NUTRITION_SIMILARITY_PATH` if
+    that file exists, or else built from the nutrient matrix.
+    """
+    path = getattr(settings, 'USDA_NUTRITION_SIMILARITY_PATH', None)
+    if path and os.path.exists(path):
+        return SimilarityIndex.load(path)
+    return SimilarityIndex.from_matrix(get_matrix())
+
+
+clear_similarity_index = get_similarity_index.clear
+
+
+def similar_foods(ndb_no, k=10, nutrients=None, food_group=None, basis='100g'):
+    """
+    Return up to `k` foods nutritionally closest to `ndb_no`, closest first,
+    optionally only comparing some nutrient numbers or only within a food
+    group (a `FoodGroup` or its code). Each food has a `distance` attribute.
+    """
+    nearest = get_similarity_index().similar(ndb_no, k, nutrients, food_group, basis)
+    foods = models.FoodDescription.objects.in_bulk([ndb_no for ndb_no, distance in nearest])
+    results = []
+    for ndb_no, distance in nearest:
+        # A saved index can be older than the database.
+        if ndb_no in foods:
+            food = foods[ndb_no]
+            food.distance = distance
+            results.append(food)
+    return results
@@ -0,0 +1,299 @@
+"""
+A compact, memory-mappable binary snapshot of the SR dataset, for read-only
+consumers that shouldn't have to run `import_usda` against a database of their
+own.
+
+Write one with `./manage.py export_snapshot PATH`, then open it anywhere with:
+
+    from usda_nutrition.snapshot import Snapshot
+
+    snapshot = Snapshot('sr28.snapshot')
+    food = snapshot.food('01001')
+    snapshot.weights('01001'), snapshot.nutrients('01001')
+
+Opening a snapshot only reads its header and section directory; every column
+is a zero-copy `memoryview` over the mapped file, and values are decoded on
+access.
+
+Layout (all integers little-endian):
+
+- header: magic, format version, number of sections
+- section directory: name, `array` typecode, offset and size of each section
+- sections, each aligned to 8 bytes
+
+Each table is stored column by column. Strings are interned into one string
+table (`strings.offsets` and `strings.data`) and columns store their ids.
+Weights, footnotes and nutrient values are sorted by food, and per-food
+offsets index (`food.weights` and so on) give the range of rows for each food.
+Missing values are stored as `NULL_ID` for strings, `NULL_INT` for integers
+and booleans, and NaN for decimals. Decimals are stored as floats.
+"""
+import array
+import bisect
+import collections
+import json
+import math
+import mmap
+import struct
+import sys
+
+
+MAGIC = b'USDASNAP'
+VERSION = 1
+HEADER = struct.Struct('<8sII')
+SECTION = struct.Struct('<48s1s7xQQ')
+ALIGNMENT = 8
+
+NULL_ID = 0xFFFFFFFF
+NULL_INT = -1
+
+# Columns of each table as (field, `array` typecode); 'S' marks an interned
+# string.
+FOOD_GROUP_COLUMNS = (('code', 'S'), ('description', 'S'))
+NUTRIENT_COLUMNS = (
+    ('nutrient_number', 'S'), ('units', 'S'), ('tagname', 'S'), ('nutrient_description', 'S'),
+    ('num_decimal_places', 'S'), ('sort_order', 'i'))
+FOOD_COLUMNS = (
+    ('ndb_no', 'S'), ('food_group_id', 'S'), ('long_desc', 'S'), ('short_desc', 'S'),
+    ('com_name', 'S'), ('manufacturer_name', 'S'), ('survey', 'b'), ('refuse_description', 'S'),
+    ('refuse', 'i'), ('scientific_name', 'S'), ('nitrogen_factor', 'd'), ('protein_factor', 'd'),
+    ('fat_factor', 'd'), ('cho_factor', 'd'))
+WEIGHT_COLUMNS = (
+    ('sequence', 'i'), ('amount', 'd'), ('measure_description', 'S'), ('gram_weight', 'd'),
+    ('number_data_points', 'i'), ('standard_deviation', 'd'))
+FOOTNOTE_COLUMNS = (
+    ('footnote_no', 'S'), ('footnote_type', 'S'), ('nutrient_definition_id', 'S'), ('footnote_text', 'S'))
+
+FoodGroup = collections.namedtuple('FoodGroup', [field for field, _ in FOOD_GROUP_COLUMNS])
+NutrientDefinition = collections.namedtuple('NutrientDefinition', [field for field, _ in NUTRIENT_COLUMNS])
+Food = collections.namedtuple('Food', [field for field, _ in FOOD_COLUMNS])
+Weight = collections.namedtuple('Weight', [field for field, _ in WEIGHT_COLUMNS])
+Footnote = collections.namedtuple('Footnote', [field for field, _ in FOOTNOTE_COLUMNS])
+
+# (section prefix, row class, columns)
+FOOD_GROUP_TABLE = ('food_group', FoodGroup, FOOD_GROUP_COLUMNS)
+NUTRIENT_TABLE = ('nutrient', NutrientDefinition, NUTRIENT_COLUMNS)
+FOOD_TABLE = ('food', Food, FOOD_COLUMNS)
+WEIGHT_TABLE = ('weight', Weight, WEIGHT_COLUMNS)
+FOOTNOTE_TABLE = ('footnote', Footnote, FOOTNOTE_COLUMNS)
+
+
+class StringTable(object):
+    def __init__(self):
+        self.ids = {}
+        self.strings = []
+
+    def intern(self, value):
+        if value is None:
+            return NULL_ID
+        if value not in self.ids:
+            self.ids[value] = len(self.strings)
+            self.strings.append(value)
+        return self.ids[value]
+
+    def sections(self):
+        offsets = array.array('I', [0])
+        data = bytearray()
+        for value in self.strings:
+            data += value.encode('utf-8')
+            offsets.append(len(data))
+        return [('strings.offsets', offsets), ('strings.data', array.array('B', bytes(data)))]
+
+
+def encode_column(typecode, values, strings):
+    if typecode == 'S':
+        return array.array('I', map(strings.intern, values))
+    if typecode == 'd':
+        return array.array('d', (math.nan if value is None else float(value) for value in values))
+    return array.array(typecode, (NULL_INT if value is None else int(value) for value in values))
+
+
+def table_sections(prefix, columns, rows, strings):
+    return [
+        ('%s.%s' % (prefix, field), encode_column(typecode, [getattr(row, field) for row in rows], strings))
+        for field, typecode in columns
+    ]
+
+
+def food_offsets(name, ndb_nos, food_ids):
+    """
+    Return a section of `len(ndb_nos) + 1` offsets such that the rows of food
+    `i` are `offsets[i]:offsets[i + 1]`, given the food id of each row.
+    """
+    positions = {ndb_no: index for index, ndb_no in enumerate(ndb_nos)}
+    counts = [0] * len(ndb_nos)
+    for food_id in food_ids:
+        counts[positions[food_id]] += 1
+    offsets = array.array('I', [0])
+    for count in counts:
+        offsets.append(offsets[-1] + count)
+    return (name, offsets)
+
+
+def write_snapshot(path, release='SR28'):
+    if sys.byteorder != 'little':
+        raise RuntimeError('Snapshots can only be written on little-endian platforms.')
+    # Imported here, so that reading a snapshot doesn't need Django settings.
+    from . import models
+
+    strings = StringTable()
+    food_groups = list(models.FoodGroup.objects.order_by('code'))
+    nutrients = list(models.NutrientDefinition.objects.order_by('sort_order', 'nutrient_number'))
+    foods = list(models.FoodDescription.objects.order_by('ndb_no'))
+    weights = list(models.Weight.objects.order_by('food_description_id', 'sequence'))
+    footnotes = list(models.Footnote.objects.order_by('food_description_id', 'pk'))
+    nutrient_values = list(models.NutrientData.objects.order_by(
+        'food_description_id', 'nutrient_definition__sort_order').values_list(
+        'food_description_id', 'nutrient_definition_id', 'nutrient_value'))
+    ndb_nos = [food.ndb_no for food in foods]
+
+    sections = []
+    tables = [FOOD_GROUP_TABLE, NUTRIENT_TABLE, FOOD_TABLE, WEIGHT_TABLE, FOOTNOTE_TABLE]
+    for (prefix, _, columns), rows in zip(tables, [food_groups, nutrients, foods, weights, footnotes]):
+        sections.extend(table_sections(prefix, columns, rows, strings))
+    nutrient_positions = {nutrient.nutrient_number: index for index, nutrient in enumerate(nutrients)}
+    sections.extend([
+        ('food.key', array.array('i', map(int, ndb_nos))),
+        food_offsets('food.weights', ndb_nos, [weight.food_description_id for weight in weights]),
+        food_offsets('food.footnotes', ndb_nos, [footnote.food_description_id for footnote in footnotes]),
+        food_offsets('food.nutrients', ndb_nos, [row[0] for row in nutrient_values]),
+        ('nutrient_value.nutrient', array.array('H', (nutrient_positions[row[1]] for row in nutrient_values))),
+        ('nutrient_value.value', array.array('d', (float(row[2]) for row in nutrient_values))),
+        ('meta', array.array('B', json.dumps({'release': release}).encode('utf-8'))),
+    ])
+    sections.extend(strings.sections())
+
+    offset = HEADER.size + SECTION.size * len(sections)
+    directory = []
+    for name, data in sections:
+        offset += -offset % ALIGNMENT
+        directory.append(SECTION.pack(name.encode('ascii'), data.typecode.encode('ascii'), offset, len(data) * data.itemsize))
+        offset += len(data) * data.itemsize
+
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(sections)))
+        f.write(b''.join(directory))
+        for name, data in sections:
+            f.write(b'\0' * (-f.tell() % ALIGNMENT))
+            f.write(data.tobytes())
+
+
+class Snapshot(object):
+    def __init__(self, path):
+        if sys.byteorder != 'little':
+            raise RuntimeError('Snapshots can only be read on little-endian platforms.')
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buffer = memoryview(self._mmap)
+        # Every view of the mapping has to be released before it can be closed.
+        self._views = [buffer]
+
+        magic, version, count = HEADER.unpack_from(buffer)
+        if magic != MAGIC:
+            raise ValueError('%s is not a snapshot file.' % path)
+        if version != VERSION:
+            raise ValueError('%s is a version %d snapshot; version %d is supported.' % (path, version, VERSION))
+
+        self._sections = {}
+        for index in range(count):
+            name, typecode, offset, size = SECTION.unpack_from(buffer, HEADER.size + index * SECTION.size)
+            view = buffer[offset:offset + size]
+            self._views.append(view)
+            self._sections[name.rstrip(b'\0').decode('ascii')] = view.cast(typecode.decode('ascii'))
+        self._views.extend(self._sections.values())
+
+        self.meta = json.loads(bytes(self._sections['meta']).decode('utf-8'))
+        self._keys = self._sections['food.key']
+        self._string_offsets = self._sections['strings.offsets']
+        self._string_data = self._sections['strings.data']
+        self._nutrient_numbers = None
+
+    def close(self):
+        self._sections = self._keys = self._string_offsets = self._string_data = None
+        for view in reversed(self._views):
+            view.release()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def string(self, string_id):
+        if string_id == NULL_ID:
+            return None
+        start, end = self._string_offsets[string_id], self._string_offsets[string_id + 1]
+        return bytes(self._string_data[start:end]).decode('utf-8')
+
+    def _value(self, typecode, value):
+        if typecode == 'S':
+            return self.string(value)
+        if typecode == 'd':
+            return None if math.isnan(value) else value
+        if typecode == 'b':
+            return None if value == NULL_INT else bool(value)
+        return None if value == NULL_INT else value
+
+    def _row(self, table, index):
+        prefix, row_cls, columns = table
+        sections = self._sections
+        return row_cls(*[
+            self._value(typecode, sections['%s.%s' % (prefix, field)][index])
+            for field, typecode in columns
+        ])
+
+    def _rows(self, table, start, end):
+        return [self._row(table, index) for index in range(start, end)]
+
+    def _food_index(self, ndb_no):
+        key = int(ndb_no)
+        index = bisect.bisect_left(self._keys, key)
+        if index == len(self._keys) or self._keys[index] != key:
+            raise KeyError(ndb_no)
+        return index
+
+    def _food_range(self, name, ndb_no):
+        offsets = self._sections[name]
+        index = self._food_index(ndb_no)
+        return offsets[index], offsets[index + 1]
+
+    def __contains__(self, ndb_no):
+        try:
+            self._food_index(ndb_no)
+        except (KeyError, ValueError):
+            return False
+        return True
+
+    def ndb_nos(self):
+        return ['%05d' % key for key in self._keys]
+
+    def food(self, ndb_no):
+        return self._row(FOOD_TABLE, self._food_index(ndb_no))
+
+    def weights(self, ndb_no):
+        return self._rows(WEIGHT_TABLE, *self._food_range('food.weights', ndb_no))
+
+    def footnotes(self, ndb_no):
+        return self._rows(FOOTNOTE_TABLE, *self._food_range('food.footnotes', ndb_no))
+
+    def nutrients(self, ndb_no):
+        """
+        Return the nutrient values per 100 g of a food, keyed by nutrient number.
+        """
+        if self._nutrient_numbers is None:
+            column = self._sections['nutrient.nutrient_number']
+            self._nutrient_numbers = [self.string(string_id) for string_id in column]
+        start, end = self._food_range('food.nutrients', ndb_no)
+        positions = self._sections['nutrient_value.nutrient'][start:end]
+        values = self._sections['nutrient_value.value'][start:end]
+        return {self._nutrient_numbers[position]: value for position, value in zip(positions, values)}
+
+    def food_groups(self):
+        return self._rows(FOOD_GROUP_TABLE, 0, len(self._sections['food_group.code']))
+
+    def nutrient_definitions(self):
+        return self._rows(NUTRIENT_TABLE, 0, len(self._sections['nutrient.nutrient_number']))
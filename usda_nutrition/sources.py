@@ -0,0 +1,107 @@
+"""
+Where `import_usda` reads the SR data files from.
+
+A source is either a directory of data files, each plain or gzip-compressed
+(`FOOD_DES.txt` or `FOOD_DES.txt.gz`), or a zip archive of them, such as the
+official `sr28asc.zip`. Files are decompressed and decoded from cp1252 as they
+are read, so they are never held in memory whole.
+
+By default, the files shipped with this package are used. Point the
+`USDA_NUTRITION_DATA_DIR` setting or `import_usda --data-dir` at a directory
+or zip archive to import from somewhere else, such as another SR release.
+"""
+import gzip
+import io
+import os
+import zipfile
+
+from django.conf import settings
+
+
+ENCODING = 'cp1252'
+
+
+def package_data_dir():
+    """
+    Return the directory holding the SR data files shipped with this package.
+    """
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'sr28')
+
+
+class DirectorySource(object):
+    def __init__(self, path):
+        self.path = path
+
+    def __str__(self):
+        return self.path
+
+    def find(self, filename):
+        for candidate in (filename, filename + '.gz'):
+            path = os.path.join(self.path, candidate)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def exists(self, filename):
+        return self.find(filename) is not None
+
+    def open(self, filename):
+        """
+        Return a text stream of a data file.
+        """
+        path = self.find(filename)
+        if path is None:
+            raise FileNotFoundError('%s not found in %s' % (filename, self.path))
+        if path.endswith('.gz'):
+            return gzip.open(path, 'rt', encoding=ENCODING, newline='')
+        return open(path, encoding=ENCODING, newline='')
+
+
+class ZipSource(object):
+    """
+    Data files are found by name, in any folder of the archive and ignoring
+    case.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._members = None
+
+    def __str__(self):
+        return self.path
+
+    def members(self):
+        if self._members is None:
+            with zipfile.ZipFile(self.path) as archive:
+                self._members = {
+                    os.path.basename(name).upper(): name
+                    for name in archive.namelist() if not name.endswith('/')
+                }
+        return self._members
+
+    def exists(self, filename):
+        return filename.upper() in self.members()
+
+    def open(self, filename):
+        """
+        Return a text stream of a data file.
+        """
+        if not self.exists(filename):
+            raise FileNotFoundError('%s not found in %s' % (filename, self.path))
+        # The member keeps the archive's file open until it is closed itself.
+        with zipfile.ZipFile(self.path) as archive:
+            member = archive.open(self.members()[filename.upper()])
+        return io.TextIOWrapper(member, encoding=ENCODING, newline='')
+
+
+def get_source(location=None):
+    """
+    Return the source for a directory or zip archive, defaulting to the
+    `USDA_NUTRITION_DATA_DIR` setting and then to the data shipped with this
+    package.
+    """
+    location = location or getattr(settings, 'USDA_NUTRITION_DATA_DIR', None) or package_data_dir()
+    if os.path.isdir(location):
+        return DirectorySource(location)
+    if os.path.isfile(location) and zipfile.is_zipfile(location):
+        return ZipSource(location)
+    raise ValueError('%s is not a directory or a zip archive.' % location)